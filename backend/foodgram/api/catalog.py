@@ -0,0 +1,49 @@
+"""
+Полный список ингредиентов, заранее закодированный в JSON и gzip.
+Каждый процесс хранит свою копию и перестраивает ее при изменении
+версии ingredients, поэтому запрос без фильтров не обращается
+ни к БД, ни к сериализатору.
+"""
+import gzip
+import re
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+from recipes.versions import VersionedIndex
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def accepts_gzip(request):
+    return bool(ACCEPTS_GZIP.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+class IngredientCatalog(VersionedIndex):
+    """Тело ответа списка ингредиентов: (JSON, JSON в gzip)."""
+
+    version_name = 'ingredients'
+
+    def build(self):
+        content = JSONRenderer().render(IngredientSerializer(
+            Ingredient.objects.all(), many=True).data)
+        return content, gzip.compress(content, mtime=0)
+
+    def response(self, request):
+        content, compressed = self.refresh()
+        if accepts_gzip(request):
+            response = HttpResponse(compressed,
+                                    content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['Content-Length'] = len(response.content)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+ingredient_catalog = IngredientCatalog()
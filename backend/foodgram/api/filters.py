@@ -1,33 +1,105 @@
+from django.db.models import Exists, OuterRef
+from django_filters.fields import MultipleChoiceField
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe, Tag, TagRecipe
+from recipes.registry import tag_registry
+from recipes.search import search_by_name
 from users.models import User
 
 
 class IngredientFilter(FilterSet):
-    """Фильтрация по вхождению букв в начало названия ингредиента."""
+    """
+    Поиск ингредиента по названию.
+    Сначала совпадения с началом названия, затем по подстроке и нечеткие.
+    """
 
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='get_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def get_name(self, queryset, name, value):
+        return search_by_name(queryset, value)
+
+
+def tag_choices():
+    return [(tag.slug, tag.name) for tag in tag_registry.current().values()]
+
+
+class TagSlugsField(MultipleChoiceField):
+    """
+    Слаги тегов. Слаг, которого нет в справочнике, ищется в БД:
+    если тег есть, справочник перестраивается.
+    """
+
+    def valid_value(self, value):
+        if super().valid_value(value):
+            return True
+        if Tag.objects.filter(slug=value).exists():
+            tag_registry.reload()
+            return True
+        return False
+
+
+class TagSlugsFilter(filters.MultipleChoiceFilter):
+    field_class = TagSlugsField
+
 
 class RecipeFilters(FilterSet):
-    """Фильтрация по автору, тегам, добавленному в избранное и в корзину."""
+    """
+    Фильтрация по автору, тегам, добавленному в избранное и в корзину.
+    Поиск по названию рецепта в порядке релевантности, только
+    с постраничной выдачей по номеру страницы.
+    Слаги тегов проверяются по справочнику tag_registry, теги
+    проверяются подзапросами EXISTS без соединения с TagRecipe:
+    tags_mode=any (по умолчанию) - рецепты хотя бы с одним из тегов,
+    tags_mode=all - со всеми тегами.
+    ordering=popular - по популярности (Recipe.popularity) вместо даты,
+    только с постраничной выдачей по номеру страницы.
+    """
 
+    TAGS_MODES = (('any', 'Любой из тегов'), ('all', 'Все теги'))
+    ORDERINGS = (('popular', 'По популярности'),)
+
+    name = filters.CharFilter(method='get_name')
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
-    tags = filters.ModelMultipleChoiceFilter(queryset=Tag.objects.all(),
-                                             field_name='tags__slug',
-                                             to_field_name='slug',)
+    tags = TagSlugsFilter(choices=tag_choices, method='get_tags')
+    tags_mode = filters.ChoiceFilter(choices=TAGS_MODES,
+                                     method='get_tags_mode')
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(choices=ORDERINGS,
+                                    method='get_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('name', 'author', 'tags', 'tags_mode', 'is_favorited',
+                  'is_in_shopping_cart', 'ordering')
+
+    def get_name(self, queryset, name, value):
+        # Курсор задает порядок по дате и отменил бы порядок релевантности.
+        if 'cursor' in self.request.query_params:
+            raise ValidationError(
+                {name: 'Поиск по названию несовместим с cursor.'})
+        return search_by_name(queryset, value)
+
+    def get_tags(self, queryset, name, value):
+        slugs = {tag.slug: tag.id for tag in tag_registry.current().values()}
+        value = [slugs[slug] for slug in value]
+        tags = TagRecipe.objects.filter(recipe=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_mode') != 'all':
+            return queryset.filter(Exists(tags.filter(tag__in=value)))
+        for tag in value:
+            queryset = queryset.filter(Exists(tags.filter(tag=tag)))
+        return queryset
+
+    def get_tags_mode(self, queryset, name, value):
+        # Учитывается в get_tags.
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -40,3 +112,9 @@ class RecipeFilters(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(cart_recipe__user=user)
         return queryset
+
+    def get_ordering(self, queryset, name, value):
+        if 'cursor' in self.request.query_params:
+            raise ValidationError(
+                {name: 'Сортировка по популярности несовместима с cursor.'})
+        return queryset.order_by('-popularity', '-id')
@@ -0,0 +1,151 @@
+"""
+Кеширование ответов API по версиям данных из recipes.versions.
+ConditionalGetMixin - заголовки ETag и Last-Modified и ответ 304,
+AnonymousCacheMixin - готовые ответы для анонимных пользователей.
+Ключ кеша ответов - версия CONTENT_VERSION, адрес и нормализованные
+параметры запроса, поэтому любое изменение рецептов, тегов
+и ингредиентов делает все сохраненные ответы недоступными.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from foodgram.settings import RESPONSE_CACHE_TIMEOUT
+from recipes.versions import (CONTENT_VERSION, get_modified, get_version,
+                              get_versions)
+
+KEY = 'response:{version}:{digest}'
+STATS_KEY = 'response:stats:{}'
+STATS = ('hits', 'misses')
+
+
+def count(name):
+    """Увеличивает общий для всех процессов счетчик статистики."""
+    key = STATS_KEY.format(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между add и incr.
+        cache.set(key, 1, timeout=None)
+
+
+def cache_stats():
+    """Число попаданий и промахов кеша ответов и доля попаданий."""
+    values = cache.get_many([STATS_KEY.format(name) for name in STATS])
+    stats = {name: values.get(STATS_KEY.format(name), 0) for name in STATS}
+    total = stats['hits'] + stats['misses']
+    stats['ratio'] = stats['hits'] / total if total else 0
+    return stats
+
+
+def reset_cache_stats():
+    cache.delete_many([STATS_KEY.format(name) for name in STATS])
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для list и retrieve по версиям наборов
+    из version_names или get_version_names(). Ответ 304 отдается
+    до выборки из БД и сериализации.
+    """
+
+    version_names = ()
+
+    def get_version_names(self):
+        return self.version_names
+
+    def get_last_modified(self, request, names):
+        """Время последнего изменения данных ответа (unix time)."""
+        return get_modified(names)
+
+    def get_etag_variant(self, request):
+        """Отличие представлений одного ресурса, например сжатие."""
+        return ''
+
+    def use_conditional(self, request):
+        """Проверять ли для запроса ETag и Last-Modified."""
+        return True
+
+    def conditional(self, handler, request, *args, **kwargs):
+        if not self.use_conditional(request):
+            return handler(request, *args, **kwargs)
+        names = self.get_version_names()
+        versions = get_versions(names)
+        modified = self.get_last_modified(request, names)
+        etag = '"{}"'.format(hashlib.md5(repr((
+            request.build_absolute_uri(), request.user.id,
+            request.accepted_renderer.format,
+            self.get_etag_variant(request),
+            sorted(versions.items()), modified)).encode()).hexdigest())
+        # Last-Modified с точностью до секунды: если изменение было
+        # в текущей секунде, следующее изменение в ней же не сдвинет
+        # заголовок, поэтому он не отдается.
+        last_modified = int(modified)
+        if last_modified >= int(time.time()):
+            last_modified = None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class AnonymousCacheMixin:
+    """
+    Кеширует ответ list на анонимный GET-запрос в JSON.
+    Параметры из cache_params сортируются, с другими параметрами
+    запрос идет мимо кеша.
+    """
+
+    cache_params = ()
+
+    def response_cache_key(self, request):
+        if (not request.user.is_anonymous
+                or request.accepted_renderer.format != 'json'
+                or set(request.query_params) - set(self.cache_params)):
+            return None
+        query = urlencode(sorted(
+            (name, value) for name in self.cache_params
+            for value in set(request.query_params.getlist(name))))
+        digest = hashlib.md5(
+            f'{request.get_host()}{request.path}?{query}'.encode()
+        ).hexdigest()
+        return KEY.format(version=get_version(CONTENT_VERSION),
+                          digest=digest)
+
+    def list(self, request, *args, **kwargs):
+        key = self.response_cache_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            count('hits')
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'HIT'
+            return response
+        count('misses')
+        response = super().list(request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+        if response.status_code == 200:
+            response.add_post_render_callback(lambda rendered: cache.set(
+                key, (rendered.content, rendered['Content-Type']),
+                timeout=RESPONSE_CACHE_TIMEOUT))
+        return response
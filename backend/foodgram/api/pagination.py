@@ -1,7 +1,98 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     """Переопределение названия результирующего поля выдачи."""
 
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(CustomPagination):
+    """
+    Постраничная выдача с переходом по курсору.
+    С параметром cursor страница выбирается по ключу (дата, id) от конца
+    предыдущей страницы: без COUNT(*) и OFFSET. Без cursor - обычная
+    выдача по номеру страницы.
+    """
+
+    cursor_query_param = 'cursor'
+    keyset = ('pub_date', 'id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def cursor_requested(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_requested(request)
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        date_field, id_field = self.keyset
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        position = self.decode_cursor(request)
+        if position:
+            date, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__lt': date})
+                | Q(**{date_field: date, f'{id_field}__lt': pk}),
+                **{f'{date_field}__lte': date})
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            self.next_position = (getattr(last, date_field),
+                                  getattr(last, id_field))
+        return page
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            date, pk = base64.urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return date, pk
+
+    def encode_cursor(self, position):
+        date, pk = position
+        return base64.urlsafe_b64encode(
+            f'{date.isoformat()}|{pk}'.encode()).decode()
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+class FeedPagination(KeysetPagination):
+    """Лента подписок: всегда по курсору, ключ - (дата, id рецепта)."""
+
+    keyset = ('pub_date', 'recipe_id')
+
+    def cursor_requested(self, request):
+        return True
@@ -0,0 +1,110 @@
+"""
+Потоковая генерация простого текстового PDF.
+Документ отдается по частям: страница формируется и отправляется,
+как только набраны ее строки, таблица xref пишется в конце.
+"""
+# Кириллица в кодировке cp1251 и ее глифы в стандартном шрифте.
+CYRILLIC_GLYPHS = (
+    [(0xA8, 'afii10023'), (0xB8, 'afii10071')]
+    + [(0xC0 + offset, f'afii{10017 + offset}') for offset in range(6)]
+    + [(0xC6 + offset, f'afii{10024 + offset}') for offset in range(26)]
+    + [(0xE0 + offset, f'afii{10065 + offset}') for offset in range(6)]
+    + [(0xE6 + offset, f'afii{10072 + offset}') for offset in range(26)]
+)
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+FONT_SIZE = 12
+LEADING = 16
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+
+def escape(text):
+    text = text.encode('cp1251', errors='replace')
+    return (text.replace(b'\\', b'\\\\')
+            .replace(b'(', b'\\(').replace(b')', b'\\)'))
+
+
+class PDFStream:
+    """Последовательная запись объектов PDF с учетом их смещений."""
+
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_number = self.FONT + 1
+
+    def write(self, data):
+        self.offset += len(data)
+        return data
+
+    def object(self, number, body):
+        self.offsets[number] = self.offset
+        return self.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def new_number(self):
+        self.next_number += 1
+        return self.next_number - 1
+
+    def header(self):
+        differences = b' '.join(b'%d /%s' % (code, name.encode())
+                                for code, name in CYRILLIC_GLYPHS)
+        return (
+            self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+            + self.object(self.CATALOG,
+                          b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+            + self.object(self.FONT, (
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                b'/Encoding << /Type /Encoding /BaseEncoding '
+                b'/WinAnsiEncoding /Differences [%s] >> >>' % differences))
+        )
+
+    def page(self, lines):
+        content = b'BT /F1 %d Tf %d TL %d %d Td ' % (
+            FONT_SIZE, LEADING, MARGIN, PAGE_HEIGHT - MARGIN)
+        content += b''.join(b'(%s) Tj T* ' % escape(line) for line in lines)
+        content += b'ET'
+        content_number = self.new_number()
+        page_number = self.new_number()
+        self.pages.append(page_number)
+        stream = b'<< /Length %d >>\nstream\n%s\nendstream' % (
+            len(content), content)
+        return (
+            self.object(content_number, stream)
+            + self.object(page_number, (
+                b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 %d 0 R >> >> '
+                b'/Contents %d 0 R >>' % (self.PAGES, PAGE_WIDTH,
+                                          PAGE_HEIGHT, self.FONT,
+                                          content_number)))
+        )
+
+    def trailer(self):
+        kids = b' '.join(b'%d 0 R' % number for number in self.pages)
+        pages = self.object(self.PAGES, b'<< /Type /Pages /Kids [%s] '
+                            b'/Count %d >>' % (kids, len(self.pages)))
+        xref_offset = self.offset
+        count = self.next_number
+        xref = b'xref\n0 %d\n0000000000 65535 f \n' % count
+        xref += b''.join(b'%010d 00000 n \n' % self.offsets[number]
+                         for number in range(1, count))
+        xref += b'trailer\n<< /Size %d /Root %d 0 R >>\n' % (
+            count, self.CATALOG)
+        xref += b'startxref\n%d\n%%%%EOF\n' % xref_offset
+        return pages + self.write(xref)
+
+
+def stream_pdf(lines):
+    """Отдает PDF по частям: заголовок, страницы, таблица xref."""
+    pdf = PDFStream()
+    yield pdf.header()
+    page = []
+    for line in lines:
+        page.append(line)
+        if len(page) == LINES_PER_PAGE:
+            yield pdf.page(page)
+            page = []
+    if page or not pdf.pages:
+        yield pdf.page(page)
+    yield pdf.trailer()
@@ -0,0 +1,94 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from api.pdf import stream_pdf
+
+TITLE = 'Cписок покупок:'
+
+
+def shopping_list_lines(ingredients):
+    yield TITLE
+    for ingredient in ingredients:
+        yield '{} - {} {}.'.format(*ingredient)
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(ABC, BaseRenderer):
+    """
+    Список покупок в одном из форматов.
+    stream() отдает файл по частям из итератора строк
+    (название, количество, единица измерения).
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Используется только для ответов с ошибками: они в JSON."""
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data, JSONRenderer.media_type,
+                                     renderer_context)
+
+    @abstractmethod
+    def stream(self, ingredients):
+        """Части файла из итератора строк списка покупок."""
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        separator = ''
+        for line in shopping_list_lines(ingredients):
+            yield separator + line
+            separator = '\n'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for ingredient in ingredients:
+            yield writer.writerow(ingredient)
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for name, amount, measurement_unit in ingredients:
+            yield separator + json.dumps(
+                {'name': name, 'amount': amount,
+                 'measurement_unit': measurement_unit},
+                ensure_ascii=False)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients):
+        return stream_pdf(shopping_list_lines(ingredients))
+
+
+SHOPPING_LIST_RENDERERS = (TextShoppingListRenderer, CSVShoppingListRenderer,
+                           JSONShoppingListRenderer, PDFShoppingListRenderer)
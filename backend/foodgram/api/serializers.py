@@ -1,13 +1,21 @@
 import base64
+from collections import defaultdict
 
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import (SetPasswordSerializer, UserCreateSerializer,
                                 UserSerializer)
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 
-from recipes.models import (Favorites, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from foodgram.settings import BATCH_LIMIT
+from recipes.cart import adjust_cart_totals
+from recipes.fragments import recipe_cards
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCartTotal, Tag, TagRecipe)
+from recipes.registry import Record, ingredient_registry, tag_registry
+from recipes.versions import bump_version_on_commit
 from users.models import Follow, User
 
 
@@ -54,12 +62,22 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if not user.is_anonymous:
             return Follow.objects.filter(user=user, author=obj).exists()
         return False
 
 
+class AuthorSerializer(serializers.ModelSerializer):
+    """Автор в карточке рецепта без флага подписки. Чтение."""
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
 class CurrentUserSerializer(CustomUserSerializer):
     """Текущий пользователь для Djoser."""
 
@@ -84,50 +102,68 @@ class RecipeSimplifiedSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class SimilarRecipeSerializer(RecipeSimplifiedSerializer):
+    """Похожий рецепт с мерой сходства. Чтение."""
+
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSimplifiedSerializer.Meta):
+        fields = RecipeSimplifiedSerializer.Meta.fields + ('score',)
+
+
 class SubscriptionsSerializer(serializers.ModelSerializer):
-    """Список подписок/ авторов пользователя. Чтение."""
+    """
+    Список подписок/ авторов пользователя. Чтение.
+    Ожидает авторов, подготовленных CustomUserViewSet.get_authors().
+    """
 
-    is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    is_subscribed = serializers.BooleanField(read_only=True)
+    recipes = RecipeSimplifiedSerializer(many=True, read_only=True,
+                                         source='latest_recipes')
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
-    def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
-
-    def get_recipes(self, obj):
-        recipes = obj.recipes.all()
-        serializer = RecipeSimplifiedSerializer(recipes,
-                                                many=True,
-                                                read_only=True)
-        return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+class BatchSerializer(serializers.Serializer):
+    """Пакетное добавление и удаление связей по id. Запись."""
 
-
-class SubscribeSerializer(serializers.ModelSerializer):
-    """Подписка на автора. Запись и удаление."""
-
-    class Meta:
-        model = Follow
-        fields = ('user', 'author')
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_LIMIT, default=list)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_LIMIT, default=list)
 
     def validate(self, data):
-        user = data['user']
-        author = data['author']
-        if user == author:
+        data = {key: list(dict.fromkeys(ids)) for key, ids in data.items()}
+        if not data['add'] and not data['remove']:
+            raise serializers.ValidationError('Передайте id в add или remove.')
+        if set(data['add']) & set(data['remove']):
             raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя.')
+                'Нельзя одновременно добавить и удалить один id.')
         return data
 
+    def results(self, allowed, added, removed):
+        """
+        Итог по каждому id: added, exists (связь уже была)
+        или invalid (объект не найден либо недоступен) для add,
+        removed или absent (связи не было) для remove.
+        """
+        return {
+            'add': [{'id': pk,
+                     'status': ('added' if pk in added
+                                else 'exists' if pk in allowed
+                                else 'invalid')}
+                    for pk in self.validated_data['add']],
+            'remove': [{'id': pk,
+                        'status': 'removed' if pk in removed else 'absent'}
+                       for pk in self.validated_data['remove']],
+        }
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Отдельный ингредиент/ список ингредиентов. Чтение."""
@@ -148,8 +184,7 @@ class TagSerializer(serializers.ModelSerializer):
 class IngredientRecipeReadSerializer(serializers.ModelSerializer):
     """Cвязь ингредиента и рецепта для чтения рецепта. Чтение."""
 
-    id = serializers.PrimaryKeyRelatedField(read_only=True,
-                                            source='ingredient.id')
+    id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit')
@@ -159,6 +194,19 @@ class IngredientRecipeReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ShoppingCartTotalSerializer(serializers.ModelSerializer):
+    """Суммарное количество ингредиента в корзине. Чтение."""
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingCartTotal
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class IngredientRecipeWriteSerializer(serializers.ModelSerializer):
     """Связь ингредиента и рецепта для записи рецепта. Запись."""
 
@@ -170,35 +218,156 @@ class IngredientRecipeWriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
-    """Рецепт. Чтение."""
+class RecipeCardSerializer(serializers.ModelSerializer):
+    """
+    Рецепт без флагов пользователя для кеша фрагментов. Чтение.
+    Теги и ингредиенты - записи справочников из render_cards.
+    Без запроса в контексте картинка - относительная ссылка.
+    """
 
-    tags = TagSerializer(many=True, read_only=True)
-    author = CustomUserSerializer(read_only=True)
-    ingredients = IngredientRecipeReadSerializer(many=True,
-                                                 read_only=True,
-                                                 source='recipes')
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    tags = TagSerializer(many=True, read_only=True, source='tag_records')
+    author = AuthorSerializer(read_only=True)
+    ingredients = IngredientRecipeReadSerializer(
+        many=True, read_only=True, source='ingredient_amounts')
     image = Base64ImageField()
 
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
+                  'text', 'cooking_time')
+
+
+class IngredientAmount(Record):
+    """Ингредиент рецепта из справочника и его количество."""
+
+    __slots__ = ('ingredient', 'amount')
+
+
+def render_cards(recipes):
+    """
+    Фрагменты рецептов для recipe_cards: {id: данные}.
+    Из БД читаются только id тегов и ингредиентов рецептов,
+    их данные берутся из справочников.
+    """
+    prefetch_related_objects(recipes, 'author')
+    tag_ids = defaultdict(set)
+    for recipe_id, tag_id in TagRecipe.objects.filter(
+            recipe__in=recipes).values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].add(tag_id)
+    rows = IngredientRecipe.objects.filter(recipe__in=recipes).order_by(
+        'id').values_list('recipe_id', 'ingredient_id', 'amount')
+    ingredients = ingredient_registry.get_many(
+        {ingredient_id for _, ingredient_id, _ in rows})
+    amounts = defaultdict(list)
+    for recipe_id, ingredient_id, amount in rows:
+        amounts[recipe_id].append(
+            IngredientAmount(ingredients[ingredient_id], amount))
+    tag_registry.get_many(set().union(*tag_ids.values()))
+    tags = tag_registry.current()
+    for recipe in recipes:
+        # Порядок тегов - порядок справочника, как у Tag.Meta.ordering.
+        recipe.tag_records = [tag for pk, tag in tags.items()
+                              if pk in tag_ids[recipe.id]]
+        recipe.ingredient_amounts = amounts[recipe.id]
+    return {recipe.id: card for recipe, card in zip(
+        recipes, RecipeCardSerializer(recipes, many=True).data)}
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: фрагменты всех рецептов берутся из кеша разом."""
+
+    def to_representation(self, data):
+        recipes = list(data)
+        cards = recipe_cards.get_many(recipes, render_cards)
+        for recipe in recipes:
+            recipe.card = cards[recipe.id]
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
+class RecipeReadSerializer(serializers.ModelSerializer):
+    """
+    Рецепт. Чтение.
+    Ожидает рецепты из Recipe.objects.with_user_flags(): общий для всех
+    фрагмент из кеша (RecipeCardSerializer) дополняется флагами
+    пользователя.
+    """
+
+    # Значения берутся из фрагмента (RecipeCardSerializer),
+    # из рецепта эти поля не читаются.
+    tags = serializers.ReadOnlyField()
+    author = serializers.ReadOnlyField()
+    ingredients = serializers.ReadOnlyField()
+    image = serializers.ReadOnlyField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
                   'name', 'image', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Favorites.objects.filter(user=user, recipe=obj).exists()
-        return False
+    def to_representation(self, instance):
+        """Поля фрагмента берутся из него, остальные - из рецепта."""
+        if not hasattr(instance, 'card'):
+            instance.card = recipe_cards.get_many(
+                [instance], render_cards)[instance.id]
+        card = {**instance.card,
+                'author': {**instance.card['author'],
+                           'is_subscribed': instance.is_subscribed}}
+        request = self.context.get('request')
+        if card['image'] and request is not None:
+            card['image'] = request.build_absolute_uri(card['image'])
+        data = {}
+        for field in self._readable_fields:
+            name = field.field_name
+            data[name] = (card[name] if name in card else
+                          field.to_representation(
+                              field.get_attribute(instance)))
+        return data
+
+
+class RecipeCoverageSerializer(RecipeReadSerializer):
+    """
+    Рецепт с числом имеющихся ингредиентов и недостающими ингредиентами.
+    Чтение. Ожидает в контексте ingredients - id имеющихся ингредиентов.
+    """
+
+    matched = serializers.IntegerField(read_only=True)
+    total = serializers.IntegerField(read_only=True)
+    missing = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('matched', 'total',
+                                                     'missing')
+
+    def get_missing(self, obj):
+        ingredients = self.context['ingredients']
+        return [item for item in obj.card['ingredients']
+                if item['id'] not in ingredients]
 
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
-        return False
+
+class RegistryField(serializers.Field):
+    """Первичный ключ записи справочника registry. Запись."""
+
+    default_error_messages = (
+        serializers.PrimaryKeyRelatedField.default_error_messages)
+
+    def __init__(self, registry, **kwargs):
+        self.registry = registry
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.registry.get_many([int(data)])[int(data)]
+        except (KeyError, ValueError):
+            self.fail('does_not_exist', pk_value=data)
+
+    def to_representation(self, value):
+        return value.id
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -206,8 +375,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     id = serializers.ReadOnlyField()
     ingredients = IngredientRecipeWriteSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all())
+    tags = serializers.ListField(child=RegistryField(tag_registry))
     image = Base64ImageField()
     author = CustomUserSerializer(read_only=True)
 
@@ -228,27 +396,78 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         if len(ingredients) != len(set([item['id'] for item in ingredients])):
             raise serializers.ValidationError(
                 'Этот ингредиент уже добавлен.')
+        ids = [item['id'] for item in ingredients]
+        if len(ingredient_registry.get_many(ids)) != len(ids):
+            raise serializers.ValidationError('Ингредиент не найден.')
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError('Этот тег уже добавлен.')
         return data
 
-    def ingredient_tag_create(self, recipe, ingredients, tags):
-        recipe.tags.set(tags)
-        IngredientRecipe.objects.bulk_create(
-            [IngredientRecipe(
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                recipe=recipe,
-                amount=ingredient['amount']) for ingredient in ingredients]
-        )
-
+    def set_ingredients(self, recipe, ingredients, created=False):
+        """
+        Приводит ингредиенты рецепта к списку ingredients только нужными
+        вставками, изменениями и удалениями строк.
+        Итоги корзин с этим рецептом меняются на разницу количеств.
+        """
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        current = {} if created else {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(recipe=recipe)}
+        deltas = {}
+        changed = []
+        removed = []
+        for ingredient_id, item in current.items():
+            if ingredient_id not in amounts:
+                deltas[ingredient_id] = -item.amount
+                removed.append(ingredient_id)
+            elif amounts[ingredient_id] != item.amount:
+                deltas[ingredient_id] = amounts[ingredient_id] - item.amount
+                item.amount = amounts[ingredient_id]
+                changed.append(item)
+        added = [IngredientRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                                  amount=amount)
+                 for ingredient_id, amount in amounts.items()
+                 if ingredient_id not in current]
+        # Строки меняются без сигналов: итоги корзин меняются ниже
+        # одним запросом на разницу, а не обработчиком на каждую строку.
+        if removed:
+            items = IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient__in=removed)
+            items._raw_delete(items.db)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        if added:
+            IngredientRecipe.objects.bulk_create(added)
+        if added or removed:
+            bump_version_on_commit('recipe_ingredients', [recipe.id])
+        if not created:
+            deltas.update((item.ingredient_id, item.amount) for item in added)
+            adjust_cart_totals(recipe.id, deltas)
+
+    def set_tags(self, recipe, tags, created=False):
+        tag_ids = {tag.id for tag in tags}
+        current = set() if created else set(
+            TagRecipe.objects.filter(recipe=recipe)
+            .values_list('tag_id', flat=True))
+        if current - tag_ids:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag__in=current - tag_ids).delete()
+        if tag_ids - current:
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe=recipe, tag_id=tag_id)
+                for tag_id in tag_ids - current)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(author=self.context.get('request').user,
                                        **validated_data)
-        self.ingredient_tag_create(recipe, ingredients, tags)
+        self.set_ingredients(recipe, ingredients, created=True)
+        self.set_tags(recipe, tags, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -257,12 +476,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
-        IngredientRecipe.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()).delete()
-        self.ingredient_tag_create(instance, ingredients, tags)
         instance.save()
+        self.set_ingredients(instance, ingredients)
+        self.set_tags(instance, tags)
         return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.with_user_flags(
+            self.context.get('request').user).get(pk=instance.pk)
         return RecipeReadSerializer(instance, context=self.context).data
@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (CustomUserViewSet, IngredientListViewSet, RecipeViewSet,
-                       TagViewSet)
+from api.views import (CustomUserViewSet, IngredientListViewSet,
+                       RecipeViewSet, ResponseCacheViewSet, TagViewSet)
 
 app_name = 'api'
 
@@ -10,6 +10,8 @@ router = DefaultRouter()
 router.register('ingredients', IngredientListViewSet,
                 basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
+router.register('response_cache', ResponseCacheViewSet,
+                basename='response_cache')
 router.register('tags', TagViewSet, basename='tags')
 router.register('users', CustomUserViewSet, basename='users')
 
@@ -1,25 +1,50 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.conf import settings
 from djoser.views import UserViewSet
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 
+from api.catalog import accepts_gzip, ingredient_catalog
 from api.filters import IngredientFilter, RecipeFilters
-from api.pagination import CustomPagination
+from api.mixins import (AnonymousCacheMixin, ConditionalGetMixin,
+                        cache_stats, reset_cache_stats)
+from api.pagination import (CustomPagination, FeedPagination,
+                            KeysetPagination)
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (CustomUserSerializer, IngredientSerializer,
-                             RecipeReadSerializer, RecipeSimplifiedSerializer,
-                             RecipeWriteSerializer, RegistrationSerializer,
-                             SubscribeSerializer, SubscriptionsSerializer,
-                             TagSerializer)
-from foodgram.settings import FILE_NAME
-from recipes.models import (Favorites, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from api.renderers import SHOPPING_LIST_RENDERERS
+from api.serializers import (BatchSerializer, CustomUserSerializer,
+                             IngredientSerializer, RecipeCoverageSerializer,
+                             RecipeReadSerializer,
+                             RecipeSimplifiedSerializer, RecipeWriteSerializer,
+                             RegistrationSerializer, SimilarRecipeSerializer,
+                             ShoppingCartTotalSerializer,
+                             SubscriptionsSerializer, TagSerializer)
+from foodgram.settings import (BATCH_LIMIT, COOK_LIMIT, FILE_NAME,
+                               INGREDIENT_SEARCH_BACKEND,
+                               INGREDIENT_SEARCH_LIMIT)
+from recipes.cart import add_to_cart_totals, remove_from_cart_totals
+from recipes.counters import increment_many
+from recipes.feed import backfill_feed, trim_feed
+from recipes.fragments import CARDS_VERSION, recipe_version
+from recipes.links import add_links, remove_all_links, remove_links
+from recipes.models import (Favorites, FeedEntry, Ingredient,
+                            IngredientRecipe, PopularityState, Recipe,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from recipes.pantry import recipe_ingredient_index
+from recipes.search import ingredient_index
+from recipes.versions import (CONTENT_VERSION, bump_version_on_commit,
+                              has_version, user_version)
 from users.models import Follow, User
 
 
@@ -34,6 +59,9 @@ class CustomUserViewSet(UserViewSet):
     permission_classes = (AllowAny,)
     http_method_names = ['get', 'post', 'delete']
 
+    def get_queryset(self):
+        return super().get_queryset().with_is_subscribed(self.request.user)
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return CustomUserSerializer
@@ -50,49 +78,106 @@ class CustomUserViewSet(UserViewSet):
         self.get_object = self.get_instance
         return self.retrieve(request, **kwargs)
 
+    def get_authors(self, authors):
+        """
+        Готовит авторов для SubscriptionsSerializer: последние
+        recipes_limit рецептов каждого автора загружаются одним запросом.
+        """
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValidationError({
+                    'recipes_limit': 'Нужно целое положительное число.'})
+            limit = int(limit)
+        authors = list(authors)
+        prefetch_related_objects(authors, Prefetch(
+            'recipes',
+            queryset=Recipe.objects.latest_per_author(authors, limit),
+            to_attr='latest_recipes'))
+        return authors
+
     @action(methods=['get'],
             detail=False,
             permission_classes=(IsAuthenticated,),
             pagination_class=CustomPagination)
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
-        page = self.paginate_queryset(queryset)
+        queryset = (User.objects.filter(following__user=request.user)
+                    .with_is_subscribed(request.user))
+        page = self.get_authors(self.paginate_queryset(queryset))
         serializer = SubscriptionsSerializer(page,
                                              many=True,
                                              context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    def change_follows(self, add=(), remove=()):
+        """
+        Подписывает на авторов add и отписывает от авторов remove
+        в одной транзакции, дополняя или сокращая ленту подписок.
+        Возвращает id затронутых авторов.
+        """
+        user_id = self.request.user.id
+        with transaction.atomic():
+            added = add_links(Follow, user_id, 'author', add)
+            removed = remove_links(Follow, user_id, 'author', remove)
+            increment_many(User, added, 'followers_count')
+            increment_many(User, removed, 'followers_count', -1)
+            backfill_feed(user_id, list(added))
+            trim_feed(user_id, removed)
+            if added or removed:
+                bump_version_on_commit(user_version(user_id))
+        return added, removed
+
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs.get('id'))
         if request.method == 'POST':
-            serializer = SubscribeSerializer(
-                data={'author': self.kwargs['id'],
-                      'user': self.request.user.id},
-                context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not Follow.objects.filter(user=request.user, author=author):
-                Follow.objects.create(user=request.user, author=author)
-                return Response(
-                    SubscriptionsSerializer(
-                        instance=User.objects.get(id=self.kwargs['id']),
-                        context={'request': request}).data,
-                    status=status.HTTP_201_CREATED)
-            return Response('Вы уже подписаны на этого пользователя.',
-                            status=status.HTTP_400_BAD_REQUEST)
-        is_in_subscriptions = Follow.objects.filter(
-            user=request.user, author=author)
-        if is_in_subscriptions:
-            is_in_subscriptions.delete()
+            author = get_object_or_404(User, id=kwargs.get('id'))
+            if author == request.user:
+                return Response('Нельзя подписаться на самого себя.',
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not self.change_follows(add=[author.id])[0]:
+                return Response('Вы уже подписаны на этого пользователя.',
+                                status=status.HTTP_400_BAD_REQUEST)
+            author.is_subscribed = True
+            author.followers_count += 1
+            author, = self.get_authors([author])
+            return Response(
+                SubscriptionsSerializer(instance=author,
+                                        context={'request': request}).data,
+                status=status.HTTP_201_CREATED)
+        if self.change_follows(remove=[kwargs.get('id')])[1]:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=kwargs.get('id'))
         return Response('Вы не подписаны на этого пользователя.',
                         status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['post'],
+            detail=False,
+            url_path='subscribe/batch',
+            permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request):
+        """Пакетная подписка и отписка: {"add": [id], "remove": [id]}."""
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add = serializer.validated_data['add']
+        allowed = set(User.objects.filter(id__in=add)
+                      .exclude(id=request.user.id)
+                      .values_list('id', flat=True))
+        added, removed = self.change_follows(
+            [pk for pk in add if pk in allowed],
+            serializer.validated_data['remove'])
+        return Response(serializer.results(allowed, added, removed))
 
-class IngredientListViewSet(viewsets.ReadOnlyModelViewSet):
-    """Получение отдельного ингредиента/ списка ингредиентов."""
+
+class IngredientListViewSet(ConditionalGetMixin,
+                            viewsets.ReadOnlyModelViewSet):
+    """
+    Получение отдельного ингредиента/ списка ингредиентов.
+    Поиск по названию для автодополнения идет по индексу в памяти
+    или по индексам БД в зависимости от INGREDIENT_SEARCH_BACKEND.
+    Полный список отдается готовым из ingredient_catalog.
+    """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -101,17 +186,42 @@ class IngredientListViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    version_names = ('ingredients',)
+
+    def get_etag_variant(self, request):
+        return self.full_catalog(request) and accepts_gzip(request)
+
+    def full_catalog(self, request):
+        return (not request.query_params
+                and request.accepted_renderer.format == 'json')
+
+    def list(self, request, *args, **kwargs):
+        if self.full_catalog(request):
+            return self.conditional(ingredient_catalog.response, request)
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        if INGREDIENT_SEARCH_BACKEND == 'memory':
+            return Response(
+                ingredient_index.search(name, INGREDIENT_SEARCH_LIMIT))
+        queryset = self.filter_queryset(
+            self.get_queryset())[:INGREDIENT_SEARCH_LIMIT]
+        return Response(self.get_serializer(queryset, many=True).data)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Получение отдельного тега/ списка тегов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    version_names = ('tags',)
 
 
-class RecipeViewSet(mixins.CreateModelMixin, mixins.DestroyModelMixin,
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    mixins.CreateModelMixin, mixins.DestroyModelMixin,
                     mixins.ListModelMixin, mixins.RetrieveModelMixin,
                     mixins.UpdateModelMixin, viewsets.GenericViewSet):
     """
@@ -121,86 +231,304 @@ class RecipeViewSet(mixins.CreateModelMixin, mixins.DestroyModelMixin,
     Добавление рецептов в избранное. Чтение и удаление.
     Добавление рецептов в корзину. Чтение и удаление.
     Формирование и скачивание списка покупок из корзины.
+    Список для анонимных пользователей берется из кеша ответов.
     """
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly,)
+    pagination_class = KeysetPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilters
     http_method_names = ['get', 'post', 'patch', 'delete']
+    cache_params = ('page', 'limit', 'tags', 'author')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_user_flags(self.request.user)
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def use_conditional(self, request):
+        """
+        Для нечисловых и несуществующих id ключи версий не создаются:
+        такой запрос идет мимо проверки. Существование рецепта
+        проверяется по БД, только если его версии еще нет в кеше.
+        """
+        if self.action == 'list':
+            return True
+        pk = self.kwargs['pk']
+        return pk.isdigit() and (
+            has_version(recipe_version(int(pk)))
+            or Recipe.objects.filter(pk=pk).exists())
+
+    def get_version_names(self):
+        """
+        Список зависит от всех рецептов, рецепт - от своей версии
+        и карточек. Флаги в выдаче зависят от избранного, корзины
+        и подписок пользователя.
+        """
+        if self.action == 'list':
+            names = [CONTENT_VERSION]
+        else:
+            names = [recipe_version(int(self.kwargs['pk'])), CARDS_VERSION]
+        if not self.request.user.is_anonymous:
+            names.append(user_version(self.request.user.id))
+        return names
+
+    def get_last_modified(self, request, names):
+        """
+        Порядок по популярности меняет команда popularity,
+        время пересчета хранится в PopularityState.
+        """
+        modified = super().get_last_modified(request, names)
+        state = ('ordering' in request.query_params
+                 and PopularityState.objects.first())
+        if not state:
+            return modified
+        return max(modified, state.updated.timestamp())
+
+    def get_ids(self, param):
+        """Список id из параметра запроса вида 1,2,3 без повторов."""
+        ids = self.request.query_params.get(param, '').split(',')
+        if not all(pk.isdigit() for pk in ids) or len(ids) > BATCH_LIMIT:
+            raise ValidationError({param: (
+                f'Нужно до {BATCH_LIMIT} целых чисел через запятую.')})
+        return list(dict.fromkeys(int(pk) for pk in ids))
+
+    def list(self, request, *args, **kwargs):
+        """
+        С параметром ids=1,2,3 (до BATCH_LIMIT id) возвращает эти рецепты
+        без пагинации в порядке запроса, отсутствующие id пропускаются.
+        """
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        ids = self.get_ids('ids')
+        recipes = self.filter_queryset(
+            self.get_queryset()).filter(id__in=ids).in_bulk()
+        return Response(self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True).data)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """
+        Избранное, корзины и ингредиенты рецепта удаляются одним
+        запросом на таблицу до каскада, без обработчиков на каждую
+        строку. Счетчик рецептов автора меняет обработчик сигнала.
+        """
+        remove_from_cart_totals([instance.id])
+        remove_all_links(Favorites, 'recipe', [instance.id])
+        remove_all_links(ShoppingCart, 'recipe', [instance.id])
+        items = IngredientRecipe.objects.filter(recipe=instance)
+        items._raw_delete(items.db)
+        bump_version_on_commit('recipe_ingredients', [instance.id])
+        instance.delete()
+
+    def change_recipes(self, model, counter, add=(), remove=()):
+        """
+        Добавляет рецепты add в избранное или корзину и удаляет
+        рецепты remove в одной транзакции, меняя счетчики рецептов
+        и итоги корзины. Возвращает id затронутых рецептов.
+        """
+        user_id = self.request.user.id
+        with transaction.atomic():
+            added = add_links(model, user_id, 'recipe', add,
+                              created=timezone.now())
+            removed = remove_links(model, user_id, 'recipe', remove)
+            increment_many(Recipe, added, counter)
+            increment_many(Recipe, removed, counter, -1)
+            if model is ShoppingCart and added:
+                add_to_cart_totals(added, user_id)
+            if model is ShoppingCart and removed:
+                remove_from_cart_totals(removed, user_id)
+            if added or removed:
+                bump_version_on_commit(user_version(user_id))
+        return added, removed
+
+    def toggle_recipe(self, model, counter, messages):
+        request = self.request
+        recipe_id = self.kwargs['pk']
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=recipe_id)
+            if not self.change_recipes(model, counter, add=[recipe.id])[0]:
+                return Response(messages[0],
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response(RecipeSimplifiedSerializer(
+                recipe, context={'request': request}).data,
+                status=status.HTTP_201_CREATED)
+        if self.change_recipes(model, counter, remove=[recipe_id])[1]:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, id=recipe_id)
+        return Response(messages[1], status=status.HTTP_400_BAD_REQUEST)
+
+    def batch_recipes(self, model, counter):
+        serializer = BatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        add = serializer.validated_data['add']
+        allowed = set(Recipe.objects.filter(id__in=add)
+                      .values_list('id', flat=True))
+        added, removed = self.change_recipes(
+            model, counter, [pk for pk in add if pk in allowed],
+            serializer.validated_data['remove'])
+        return Response(serializer.results(allowed, added, removed))
+
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=(IsAuthorOrReadOnly,))
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        if request.method == 'POST':
-            serializer = RecipeSimplifiedSerializer(recipe,
-                                                    data=request.data,
-                                                    context={
-                                                        "request": request})
-            serializer.is_valid(raise_exception=True)
-            if not Favorites.objects.filter(user=request.user,
-                                            recipe=recipe).exists():
-                Favorites.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response('Рецепт уже добавлен в избранное.',
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        is_in_favorites = Favorites.objects.filter(
-            user=request.user, recipe=recipe)
-        if is_in_favorites:
-            is_in_favorites.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response('В избранном пусто, нечего удалять.',
-                        status=status.HTTP_400_BAD_REQUEST)
+        return self.toggle_recipe(Favorites, 'favorites_count', (
+            'Рецепт уже добавлен в избранное.',
+            'В избранном пусто, нечего удалять.'))
+
+    @action(methods=['post'],
+            detail=False,
+            url_path='favorite/batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        """Пакетное изменение избранного: {"add": [id], "remove": [id]}."""
+        return self.batch_recipes(Favorites, 'favorites_count')
 
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=(IsAuthorOrReadOnly,),
             pagination_class=None)
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        if request.method == 'POST':
-            serializer = RecipeSimplifiedSerializer(
-                recipe, data=request.data, context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not ShoppingCart.objects.filter(user=request.user,
-                                               recipe=recipe).exists():
-                ShoppingCart.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response('Рецепт уже добавлен в корзину.',
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        is_in_shopping_cart = ShoppingCart.objects.filter(
-            user=request.user, recipe=recipe)
-        if is_in_shopping_cart:
-            is_in_shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response('Корзина пуста, нечего удалять.',
-                        status=status.HTTP_400_BAD_REQUEST)
+        return self.toggle_recipe(ShoppingCart, 'cart_count', (
+            'Рецепт уже добавлен в корзину.',
+            'Корзина пуста, нечего удалять.'))
+
+    @action(methods=['post'],
+            detail=False,
+            url_path='shopping_cart/batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        """Пакетное изменение корзины: {"add": [id], "remove": [id]}."""
+        return self.batch_recipes(ShoppingCart, 'cart_count')
+
+    @action(methods=['get'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь,
+        от новых к старым, с переходом по курсору.
+        """
+        entries = self.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user))
+        recipes = Recipe.objects.with_user_flags(request.user).in_bulk(
+            [entry.recipe_id for entry in entries])
+        page = [recipes[entry.recipe_id] for entry in entries
+                if entry.recipe_id in recipes]
+        return self.get_paginated_response(RecipeReadSerializer(
+            page, many=True, context={'request': request}).data)
+
+    @action(methods=['get'],
+            detail=True,
+            permission_classes=(AllowAny,),
+            pagination_class=None)
+    def similar(self, request, **kwargs):
+        """
+        Похожие рецепты из таблицы SimilarRecipe,
+        которую заполняет команда similar_recipes.
+        """
+        recipes = (Recipe.objects
+                   .filter(similar_to__recipe=kwargs['pk'])
+                   .annotate(score=F('similar_to__score'))
+                   .order_by('-score', 'id'))
+        data = SimilarRecipeSerializer(recipes, many=True,
+                                       context={'request': request}).data
+        if not data:
+            get_object_or_404(Recipe, id=kwargs['pk'])
+        return Response(data)
 
     @action(methods=['get'],
             detail=False,
-            permission_classes=(IsAuthenticated, IsAuthorOrReadOnly,))
+            permission_classes=(AllowAny,),
+            pagination_class=None)
+    def cook(self, request):
+        """
+        Что приготовить из имеющихся ингредиентов ingredients=1,2,3:
+        до limit рецептов (по умолчанию COOK_LIMIT), упорядоченных
+        по доле имеющихся ингредиентов, с недостающими ингредиентами.
+        """
+        ingredients = self.get_ids('ingredients')
+        limit = request.query_params.get('limit', str(COOK_LIMIT))
+        if not limit.isdigit() or not 0 < int(limit) <= BATCH_LIMIT:
+            raise ValidationError(
+                {'limit': f'Нужно целое число от 1 до {BATCH_LIMIT}.'})
+        ranked = recipe_ingredient_index.rank(ingredients, int(limit))
+        recipes = Recipe.objects.with_user_flags(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked])
+        found = []
+        for recipe_id, matched, total in ranked:
+            # Рецепт мог быть удален после построения индекса.
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.matched, recipe.total = matched, total
+                found.append(recipe)
+        return Response(RecipeCoverageSerializer(
+            found, many=True,
+            context={'request': request,
+                     'ingredients': set(ingredients)}).data)
+
+    @action(methods=['get'],
+            detail=False,
+            permission_classes=(IsAuthenticated, IsAuthorOrReadOnly,),
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request, **kwargs):
-        ingredients = (IngredientRecipe.objects
-                       .filter(recipe__cart_recipe__user=request.user)
-                       .values('ingredient')
-                       .annotate(total_amount=Sum('amount'))
-                       .values_list('ingredient__name', 'total_amount',
-                                    'ingredient__measurement_unit'))
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(*ingredient)) for ingredient in ingredients]
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
-        file['Content-Disposition'] = (f'attachment; filename={FILE_NAME}')
+        """
+        Список покупок отдается потоком по мере чтения из БД.
+        Формат выбирается параметром format (txt, csv, json, pdf)
+        или заголовком Accept, по умолчанию txt.
+        """
+        ingredients = (ShoppingCartTotal.objects
+                       .filter(user=request.user)
+                       .values_list('ingredient__name', 'amount',
+                                    'ingredient__measurement_unit')
+                       .order_by('ingredient__name')
+                       .iterator())
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        file = StreamingHttpResponse(renderer.stream(ingredients),
+                                     content_type=content_type)
+        file_name = Path(FILE_NAME).with_suffix(f'.{renderer.format}')
+        file['Content-Disposition'] = f'attachment; filename={file_name}'
         return file
+
+    @action(methods=['get'],
+            detail=False,
+            url_path='shopping_cart',
+            permission_classes=(IsAuthenticated,),
+            pagination_class=None)
+    def shopping_cart_summary(self, request, **kwargs):
+        """Суммарные количества ингредиентов в корзине пользователя."""
+        totals = (ShoppingCartTotal.objects
+                  .filter(user=request.user)
+                  .select_related('ingredient')
+                  .order_by('ingredient__name'))
+        return Response(ShoppingCartTotalSerializer(totals, many=True).data)
+
+
+class ResponseCacheViewSet(viewsets.ViewSet):
+    """
+    Статистика кеша ответов для анонимных пользователей, только для
+    администраторов. Отдается веб-процессом: с LocMemCache это
+    счетчики воркера, обработавшего запрос, с memcached - общие.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        return Response(cache_stats())
+
+    @action(methods=['post'], detail=False)
+    def reset(self, request):
+        reset_cache_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
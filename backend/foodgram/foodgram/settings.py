@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'recipes.registry.RegistryMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -79,6 +81,17 @@ DATABASES = {
     }
 }
 
+# Версии данных и кеш ответов должны быть общими для всех воркеров
+# и команд, поэтому по умолчанию - memcached из docker-compose.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='memcached:11211'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -156,3 +169,21 @@ CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
 FILE_NAME = 'Список_покупок.txt'
+
+INGREDIENT_SEARCH_LIMIT = 50
+# memory - индекс в памяти процесса, database - индексы БД (pg_trgm).
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND',
+                                      default='memory')
+
+# Наибольшее число id в add и remove пакетных эндпоинтов.
+BATCH_LIMIT = 100
+# Число рецептов в подборе по имеющимся ингредиентам по умолчанию.
+COOK_LIMIT = 20
+# Кеш представлений рецептов: число фрагментов в памяти процесса
+# и время жизни фрагмента в общем кеше в секундах.
+RECIPE_CACHE_SIZE = 2000
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+# Время жизни готовых ответов для анонимных пользователей в секундах.
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+# Число подписчиков, получающих новый рецепт в ленту за одну транзакцию.
+FEED_BATCH_SIZE = 1000
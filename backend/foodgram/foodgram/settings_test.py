@@ -0,0 +1,25 @@
+"""
+Настройки для запуска тестов.
+Если БД не задана через окружение, тесты идут на SQLite в памяти,
+кеш - в памяти процесса.
+"""
+import os
+
+from foodgram.settings import *  # noqa: F401,F403
+
+if 'DB_ENGINE' not in os.environ:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }
+
+if 'CACHE_BACKEND' not in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -41,16 +41,14 @@ class RecipeAdmin(admin.ModelAdmin):
     """Отображение рецептов в админ-панели."""
 
     list_display = ('pk', 'author', 'pub_date', 'name', 'get_ingredients',
-                    'text', 'image', 'cooking_time', 'count_favorites',)
+                    'text', 'image', 'cooking_time', 'favorites_count',
+                    'cart_count',)
     list_editable = ('name', 'text', 'image', 'cooking_time',)
     search_fields = ('author__username', 'name', 'tags__name',)
     list_filter = ('author', 'tags', 'name',)
     empty_value_display = '-пусто-'
     inlines = [IngredientRecipeInline, TagRecipeInline]
 
-    def count_favorites(self, obj):
-        return Favorites.objects.filter(recipe=obj).count()
-
     def get_ingredients(self, obj):
         return ", ".join([i.name for i in obj.ingredients.all()])
 
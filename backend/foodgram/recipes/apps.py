@@ -1,7 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Управление рецептами'
+
+    def ready(self):
+        from recipes import signals
+        post_migrate.connect(signals.search_indexes, sender=self)
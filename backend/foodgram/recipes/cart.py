@@ -0,0 +1,112 @@
+"""
+Поддержка таблицы ShoppingCartTotal.
+Функции вызываются в транзакции вместе с изменением корзины
+или ингредиентов рецепта.
+"""
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingCartTotal
+
+ADD_SQL = '''
+    INSERT INTO {totals} (user_id, ingredient_id, amount)
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+    FROM {cart} AS cart
+    JOIN {items} AS item ON item.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id IN ({recipes}) {user_filter}
+    GROUP BY cart.user_id, item.ingredient_id
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {totals}.amount + EXCLUDED.amount
+'''
+
+ADJUST_SQL = '''
+    INSERT INTO {totals} (user_id, ingredient_id, amount)
+    SELECT cart.user_id, delta.ingredient_id, delta.amount
+    FROM {cart} AS cart
+    CROSS JOIN ({deltas}) AS delta
+    WHERE cart.recipe_id = %s
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {totals}.amount + EXCLUDED.amount
+'''
+DELTA_SQL = 'SELECT %s AS ingredient_id, %s AS amount'
+
+REBUILD_SQL = '''
+    INSERT INTO {totals} (user_id, ingredient_id, amount)
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+    FROM {cart} AS cart
+    JOIN {items} AS item ON item.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, item.ingredient_id
+'''
+TABLES = {
+    'totals': ShoppingCartTotal._meta.db_table,
+    'cart': ShoppingCart._meta.db_table,
+    'items': IngredientRecipe._meta.db_table,
+}
+
+
+def add_to_cart_totals(recipe_ids, user_id=None):
+    """
+    Добавляет ингредиенты рецептов к итогам пользователя user_id
+    или всех пользователей, у которых рецепты в корзине.
+    Вызывается после добавления рецептов в корзину.
+    """
+    params = list(recipe_ids)
+    user_filter = ''
+    if user_id is not None:
+        user_filter = 'AND cart.user_id = %s'
+        params.append(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_SQL.format(
+            recipes=', '.join(['%s'] * len(recipe_ids)),
+            user_filter=user_filter, **TABLES), params)
+
+
+def remove_from_cart_totals(recipe_ids, user_id=None):
+    """
+    Вычитает ингредиенты рецептов из итогов, обратно add_to_cart_totals.
+    Для пользователя user_id вызывается после удаления рецептов
+    из его корзины, для всех пользователей - до удаления рецептов.
+    """
+    items = IngredientRecipe.objects.filter(recipe__in=recipe_ids)
+    removed = items.filter(ingredient=OuterRef('ingredient'))
+    if user_id is None:
+        users = ShoppingCart.objects.filter(
+            recipe__in=recipe_ids).values('user')
+        removed = removed.filter(recipe__cart_recipe__user=OuterRef('user'))
+    else:
+        users = [user_id]
+    totals = ShoppingCartTotal.objects.filter(
+        user__in=users, ingredient__in=items.values('ingredient'))
+    totals.update(amount=F('amount') - Coalesce(Subquery(
+        removed.order_by().values('ingredient')
+        .annotate(total=Sum('amount')).values('total')), 0))
+    totals.filter(amount__lte=0).delete()
+
+
+def adjust_cart_totals(recipe_id, deltas):
+    """
+    Применяет изменения количеств ингредиентов рецепта
+    {ingredient_id: разница} к итогам всех корзин с этим рецептом.
+    """
+    if not deltas:
+        return
+    params = [value for delta in deltas.items() for value in delta]
+    with connection.cursor() as cursor:
+        cursor.execute(ADJUST_SQL.format(
+            deltas=' UNION ALL '.join([DELTA_SQL] * len(deltas)), **TABLES),
+            params + [recipe_id])
+    if any(delta < 0 for delta in deltas.values()):
+        ShoppingCartTotal.objects.filter(
+            user__in=ShoppingCart.objects.filter(
+                recipe=recipe_id).values('user'),
+            ingredient__in=list(deltas),
+            amount__lte=0).delete()
+
+
+@transaction.atomic
+def rebuild_cart_totals():
+    """Пересчитывает итоги всех корзин с нуля агрегацией по корзинам."""
+    ShoppingCartTotal.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL.format(**TABLES))
@@ -0,0 +1,45 @@
+"""
+Денормализованные счетчики: Recipe.favorites_count, Recipe.cart_count,
+User.recipes_count и User.followers_count.
+Изменяются атомарно через F() вместе с изменением связей: API - явно,
+удаления из админки и каскадные - обработчиками сигналов.
+Счетчик не опускается ниже нуля, даже если успел разойтись с данными;
+команда recount пересчитывает их заново.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorites, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+def shifted(field, delta):
+    """Значение поля field, измененное на delta, но не меньше нуля."""
+    return Greatest(F(field) + delta, 0)
+
+
+def increment(model, pk, field, delta=1):
+    model.objects.filter(pk=pk).update(**{field: shifted(field, delta)})
+
+
+def increment_many(model, pks, field, delta=1):
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: shifted(field, delta)})
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся на объект через field."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField()), 0)
+
+
+def recount():
+    """Пересчитывает все счетчики по фактическим данным."""
+    Recipe.objects.update(favorites_count=count_of(Favorites, 'recipe'),
+                          cart_count=count_of(ShoppingCart, 'recipe'))
+    User.objects.update(recipes_count=count_of(Recipe, 'author'),
+                        followers_count=count_of(Follow, 'author'))
@@ -0,0 +1,80 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+Записи FeedEntry создаются после публикации рецепта для всех подписчиков
+автора, добавляются при подписке и удаляются при отписке,
+поэтому чтение ленты - один запрос по индексу.
+"""
+from functools import partial
+
+from django.db import connection, transaction
+
+from foodgram.settings import FEED_BATCH_SIZE
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+FILL_SQL = '''
+    INSERT INTO {feed} (user_id, recipe_id, author_id, pub_date)
+    SELECT follow.user_id, recipe.id, recipe.author_id, recipe.pub_date
+    FROM {follow} AS follow
+    JOIN {recipe} AS recipe ON recipe.author_id = follow.author_id
+    WHERE {condition}
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+'''
+TABLES = {
+    'feed': FeedEntry._meta.db_table,
+    'follow': Follow._meta.db_table,
+    'recipe': Recipe._meta.db_table,
+}
+
+
+def fill_feed(condition, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(FILL_SQL.format(condition=condition, **TABLES),
+                       params)
+
+
+def fan_out(recipe_id, author_id, batch_size=FEED_BATCH_SIZE):
+    """
+    Добавляет новый рецепт в ленты подписчиков автора пачками
+    по диапазонам id подписок, каждая пачка - в своей транзакции.
+    Рецепт, удаленный до вставки, в ленты не попадает.
+    """
+    last_id = 0
+    while True:
+        ids = list(Follow.objects
+                   .filter(author=author_id, id__gt=last_id)
+                   .order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            fill_feed('recipe.id = %s AND follow.id BETWEEN %s AND %s',
+                      [recipe_id, ids[0], ids[-1]])
+        last_id = ids[-1]
+
+
+def fan_out_on_commit(recipe):
+    """Рассылает рецепт по лентам после фиксации его создания."""
+    transaction.on_commit(partial(fan_out, recipe.id, recipe.author_id))
+
+
+def backfill_feed(user_id, author_ids):
+    """Добавляет в ленту рецепты авторов, на которых подписался user_id."""
+    if author_ids:
+        fill_feed('follow.user_id = %s AND follow.author_id IN ({})'.format(
+            ', '.join(['%s'] * len(author_ids))),
+            [user_id, *author_ids])
+
+
+def trim_feed(user_id, author_ids):
+    """Убирает из ленты рецепты авторов, от которых пользователь отписался."""
+    if author_ids:
+        FeedEntry.objects.filter(user=user_id,
+                                 author__in=author_ids).delete()
+
+
+@transaction.atomic
+def rebuild_feed():
+    """Строит ленты всех пользователей заново по подпискам."""
+    FeedEntry.objects.all().delete()
+    fill_feed('1 = 1')
@@ -0,0 +1,91 @@
+"""
+Кеш представлений рецептов, не зависящих от пользователя.
+Ключ фрагмента - id рецепта, версия рецепта и общая версия карточек
+(теги, ингредиенты, авторы). Версии меняют обработчики сигналов,
+поэтому устаревший фрагмент просто перестает запрашиваться.
+Фрагменты хранятся в общем кеше Django и в ограниченном LRU-кеше
+процесса, который избавляет от повторной загрузки фрагмента.
+"""
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from foodgram.settings import RECIPE_CACHE_SIZE, RECIPE_CACHE_TIMEOUT
+from recipes.versions import get_versions
+
+CARDS_VERSION = 'recipe_cards'
+KEY = 'recipe_card:{pk}:{version}:{cards}'
+
+
+def recipe_version(pk):
+    """Имя версии фрагмента рецепта pk."""
+    return f'recipe:{pk}'
+
+
+class LRUCache:
+    """Не более size значений, вытесняются давно не использованные."""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+class FragmentCache:
+    """Фрагменты рецептов в памяти процесса и в общем кеше."""
+
+    def __init__(self, size):
+        self.local = LRUCache(size)
+
+    def get_many(self, recipes, render):
+        """
+        Фрагменты рецептов {id: фрагмент}. Отсутствующие в обоих кешах
+        строит render(список рецептов) и сохраняет в них.
+        """
+        versions = get_versions(
+            [CARDS_VERSION] + [recipe_version(recipe.pk)
+                               for recipe in recipes])
+        cards = versions[CARDS_VERSION]
+        keys = {}
+        for recipe in recipes:
+            version = versions[recipe_version(recipe.pk)]
+            keys[recipe.pk] = KEY.format(pk=recipe.pk, version=version,
+                                         cards=cards)
+        fragments = {}
+        for pk, key in keys.items():
+            fragment = self.local.get(key)
+            if fragment is not None:
+                fragments[pk] = fragment
+        missing = {keys[pk]: pk for pk in keys if pk not in fragments}
+        if missing:
+            for key, fragment in cache.get_many(missing).items():
+                fragments[missing[key]] = fragment
+                self.local.set(key, fragment)
+        recipes = [recipe for recipe in recipes if recipe.pk not in fragments]
+        if recipes:
+            rendered = render(recipes)
+            cache.set_many({keys[pk]: fragment
+                            for pk, fragment in rendered.items()},
+                           timeout=RECIPE_CACHE_TIMEOUT)
+            for pk, fragment in rendered.items():
+                self.local.set(keys[pk], fragment)
+            fragments.update(rendered)
+        return fragments
+
+
+recipe_cards = FragmentCache(RECIPE_CACHE_SIZE)
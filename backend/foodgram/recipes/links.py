@@ -0,0 +1,68 @@
+"""
+Связи пользователя с рецептами или авторами (избранное, корзина, подписки).
+Добавление и удаление - по одному запросу на любое число связей,
+повторы отсекаются уникальными ограничениями моделей,
+а не предварительной проверкой. Запросы идут мимо сигналов моделей:
+счетчики и итоги корзин меняет вызывающий код.
+"""
+from django.db import connection
+
+INSERT_SQL = '''
+    INSERT INTO {table} ({user}, {target}{columns}) VALUES {values}
+    ON CONFLICT DO NOTHING RETURNING {target}
+'''
+DELETE_SQL = '''
+    DELETE FROM {table} WHERE {user} = %s AND {target} IN ({values})
+    RETURNING {target}
+'''
+DELETE_ALL_SQL = '''
+    DELETE FROM {table} WHERE {target} IN ({values}) RETURNING {target}
+'''
+
+
+def execute(sql, model, target, params, values, columns=''):
+    opts = model._meta
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(table=opts.db_table,
+                                  user=opts.get_field('user').column,
+                                  target=opts.get_field(target).column,
+                                  columns=columns,
+                                  values=values), params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def add_links(model, user_id, target, ids, **fields):
+    """
+    Связывает пользователя с объектами ids через поле target модели.
+    fields - значения остальных полей новых строк.
+    Возвращает id объектов, для которых строки добавлены.
+    """
+    if not ids:
+        return set()
+    extra = [model._meta.get_field(name) for name in fields]
+    values = [field.get_db_prep_save(fields[field.name], connection)
+              for field in extra]
+    row = '({})'.format(', '.join(['%s'] * (2 + len(extra))))
+    return execute(INSERT_SQL, model, target,
+                   [value for pk in ids for value in (user_id, pk, *values)],
+                   ', '.join([row] * len(ids)),
+                   ''.join(f', {field.column}' for field in extra))
+
+
+def remove_links(model, user_id, target, ids):
+    """Удаляет связи, возвращает id объектов, для которых они были."""
+    if not ids:
+        return set()
+    return execute(DELETE_SQL, model, target, [user_id, *ids],
+                   ', '.join(['%s'] * len(ids)))
+
+
+def remove_all_links(model, target, ids):
+    """
+    Удаляет связи всех пользователей с объектами ids одним запросом,
+    без сигналов удаления по каждой строке.
+    """
+    if not ids:
+        return set()
+    return execute(DELETE_ALL_SQL, model, target, list(ids),
+                   ', '.join(['%s'] * len(ids)))
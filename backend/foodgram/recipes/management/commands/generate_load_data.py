@@ -0,0 +1,155 @@
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cart import rebuild_cart_totals
+from recipes.counters import recount
+from recipes.feed import rebuild_feed
+from recipes.models import (Favorites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagRecipe)
+from recipes.versions import CONTENT_VERSION, bump_version
+from users.models import Follow, User
+
+
+def zipf_weights(count, alpha):
+    """Накопленные веса степенного распределения для random.choices."""
+    return list(itertools.accumulate(
+        1 / (rank ** alpha) for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических данных для нагрузочного тестирования: '
+            'пользователи, рецепты, теги и ингредиенты рецептов, подписки, '
+            'избранное и корзины. Авторы и подписчики распределены '
+            'по степенному закону.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 15), metavar=('MIN', 'MAX'))
+        parser.add_argument('--tags-per-recipe', type=int, nargs=2,
+                            default=(1, 3), metavar=('MIN', 'MAX'))
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--author-alpha', type=float, default=1.1,
+                            help='Показатель степени для числа рецептов '
+                                 'у автора.')
+        parser.add_argument('--follower-alpha', type=float, default=1.2,
+                            help='Показатель степени для числа подписчиков '
+                                 'и популярности рецептов.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='load',
+                            help='Префикс имен пользователей и рецептов.')
+        parser.add_argument('--password', default='loadtest',
+                            help='Пароль всех созданных пользователей.')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Данные с префиксом {prefix} уже есть. '
+                f'Укажите другой --prefix.')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError('Сначала загрузите ингредиенты командой '
+                               'import_data и создайте теги.')
+        started = time.monotonic()
+
+        password = make_password(options['password'])
+        self.create(User, (
+            User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@load.test',
+                 first_name='Нагрузочный', last_name=f'Пользователь {i}',
+                 password=password)
+            for i in range(options['users'])))
+        user_ids = list(User.objects.filter(
+            username__startswith=f'{prefix}_').values_list('id', flat=True))
+        self.random.shuffle(user_ids)
+
+        authors = self.random.choices(
+            user_ids, cum_weights=zipf_weights(len(user_ids),
+                                               options['author_alpha']),
+            k=options['recipes'])
+        self.create(Recipe, (
+            Recipe(author_id=author_id, name=f'{prefix}_{i}',
+                   text='Сгенерированный рецепт.',
+                   image='recipes/load.png',
+                   cooking_time=self.random.randint(1, 240))
+            for i, author_id in enumerate(authors)))
+        recipe_ids = list(Recipe.objects.filter(
+            name__startswith=f'{prefix}_').values_list('id', flat=True))
+        self.random.shuffle(recipe_ids)
+
+        low, high = options['ingredients_per_recipe']
+        self.create(IngredientRecipe, (
+            IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=self.random.randint(1, 1000))
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids,
+                min(self.random.randint(low, high), len(ingredient_ids)))))
+        low, high = options['tags_per_recipe']
+        self.create(TagRecipe, (
+            TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(
+                tag_ids, min(self.random.randint(low, high), len(tag_ids)))))
+
+        popular_users = zipf_weights(len(user_ids), options['follower_alpha'])
+        self.create(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in self.pick(user_ids, popular_users,
+                                       options['follows_per_user'])
+            if author_id != user_id))
+        popular_recipes = zipf_weights(len(recipe_ids),
+                                       options['follower_alpha'])
+        self.create(Favorites, (
+            Favorites(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.pick(recipe_ids, popular_recipes,
+                                       options['favorites_per_user'])))
+        self.create(ShoppingCart, (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.pick(recipe_ids, popular_recipes,
+                                       options['cart_per_user'])))
+        recount()
+        rebuild_cart_totals()
+        rebuild_feed()
+        bump_version('recipe_ingredients')
+        bump_version(CONTENT_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с.'))
+
+    def pick(self, population, cum_weights, count):
+        """До count различных элементов с учетом весов популярности."""
+        if not count:
+            return set()
+        return set(self.random.choices(population, cum_weights=cum_weights,
+                                       k=count))
+
+    def create(self, model, objects):
+        """Пакетная вставка объектов из генератора в одной транзакции."""
+        started = time.monotonic()
+        total = 0
+        with transaction.atomic():
+            while True:
+                batch = list(itertools.islice(objects, self.batch_size))
+                if not batch:
+                    break
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+                total += len(batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {total} строк '
+            f'за {elapsed:.1f} с ({total / max(elapsed, 1e-6):.0f} строк/с)')
@@ -1,20 +1,97 @@
 import csv
+import itertools
+import json
+import time
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from recipes.models import Ingredient
+from recipes.versions import CONTENT_VERSION, bump_version_on_commit
+
+DEFAULT_PATH = settings.BASE_DIR.parent.parent / 'data' / 'ingredients.csv'
+READ_SIZE = 64 * 1024
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as fixture:
+        for row in csv.reader(fixture):
+            if row:
+                yield row
+
+
+def read_json(path):
+    """Потоковое чтение JSON-массива объектов без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as fixture:
+        buffer = fixture.read(READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError('Ожидается JSON-массив ингредиентов.')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = fixture.read(READ_SIZE)
+                if not chunk:
+                    raise CommandError('Файл JSON поврежден или обрезан.')
+                buffer += chunk
+                continue
+            yield item['name'], item['measurement_unit']
+            buffer = buffer[end:]
+
+
+READERS = {'csv': read_csv, 'json': read_json}
 
 
 class Command(BaseCommand):
-    help = 'Скрипт для импорта тестовых данных/ингредиентов в БД из csv-файла'
+    help = ('Скрипт для импорта ингредиентов в БД из csv- или json-файла. '
+            'Повторный запуск не создает дубликатов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH,
+                            type=Path)
+        parser.add_argument('--format', choices=READERS,
+                            help='Формат файла. По умолчанию определяется '
+                                 'по расширению.')
+        parser.add_argument('--batch-size', type=int, default=1000)
 
     def handle(self, *args, **options):
-        with open('../../data/ingredients.csv',
-                  encoding='utf-8') as fixture:
-            reader = csv.reader(fixture)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit)
-        print('Скрипт выполнен. Данные импортированы')
+        path = options['path']
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        started = time.monotonic()
+        seen = set()
+        rows = 0
+        before = Ingredient.objects.count()
+        reader = READERS[file_format](path)
+        chunks = iter(
+            lambda: list(itertools.islice(reader, options['batch_size'])), [])
+        with transaction.atomic():
+            for chunk in chunks:
+                rows += len(chunk)
+                batch = []
+                for name, measurement_unit in chunk:
+                    key = (name.strip(), measurement_unit.strip())
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    batch.append(Ingredient(name=key[0],
+                                            measurement_unit=key[1]))
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            bump_version_on_commit('ingredients')
+            bump_version_on_commit(CONTENT_VERSION)
+        created = Ingredient.objects.count() - before
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Скрипт выполнен. Прочитано строк: {rows}, добавлено '
+            f'ингредиентов: {created} за {elapsed:.2f} с '
+            f'({rows / max(elapsed, 1e-6):.0f} строк/с).'))
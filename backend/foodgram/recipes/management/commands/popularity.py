@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import update_popularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчет популярности рецептов для ordering=popular '
+            'по добавлениям в избранное и корзину с затуханием по времени. '
+            'Запускается периодически, учитывает только новые события.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--half-life', type=float, default=72,
+                            help='Период полураспада веса события в часах.')
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать с нуля, учитывая удаления.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = update_popularity(timedelta(hours=options['half_life']),
+                                  full=options['full'],
+                                  batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность обновлена у {count} рецептов '
+            f'за {time.monotonic() - started:.1f} с.'))
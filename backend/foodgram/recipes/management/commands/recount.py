@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cart import rebuild_cart_totals
+from recipes.counters import recount
+from recipes.feed import rebuild_feed
+
+
+class Command(BaseCommand):
+    help = ('Пересчет денормализованных данных: счетчиков избранного, '
+            'корзин, рецептов и подписчиков, итогов списков покупок '
+            'и лент подписок.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recount()
+        rebuild_cart_totals()
+        rebuild_feed()
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.mixins import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Статистика кеша ответов для анонимных пользователей: '
+            'попадания, промахи и доля попаданий. Счетчики видны команде '
+            'только в общем кеше (memcached), с LocMemCache статистику '
+            'отдает воркер по адресу /api/response_cache/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счетчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(f'Попадания: {stats["hits"]}, '
+                          f'промахи: {stats["misses"]}, '
+                          f'доля попаданий: {stats["ratio"]:.1%}')
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import IngredientRecipe, SimilarRecipe, TagRecipe
+from recipes.similar import chunk_size, feature_matrix, init_worker, nearest
+
+
+class Command(BaseCommand):
+    help = ('Пересчет похожих рецептов: для каждого рецепта сохраняются '
+            'top-k рецептов по косинусному сходству ингредиентов и тегов. '
+            'Запускается периодически, новые рецепты получают похожие '
+            'при следующем запуске.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=10)
+        parser.add_argument('--tag-weight', type=float, default=0.5,
+                            help='Вес тега относительно ингредиента.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Число процессов для расчета блоков.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipe_ids, features = feature_matrix(
+            list(IngredientRecipe.objects.values_list('recipe_id',
+                                                      'ingredient_id')),
+            list(TagRecipe.objects.filter(tag__isnull=False)
+                 .values_list('recipe_id', 'tag_id')),
+            options['tag_weight'])
+        starts = range(0, len(recipe_ids), chunk_size(len(recipe_ids)))
+        if options['workers'] > 1 and len(starts) > 1:
+            with ProcessPoolExecutor(
+                    options['workers'], initializer=init_worker,
+                    initargs=(features, options['top_k'])) as pool:
+                chunks = list(pool.map(nearest, starts))
+        else:
+            init_worker(features, options['top_k'])
+            chunks = [nearest(start) for start in starts]
+
+        total = 0
+        with transaction.atomic():
+            SimilarRecipe.objects.all().delete()
+            for rows, columns, scores in chunks:
+                SimilarRecipe.objects.bulk_create(
+                    (SimilarRecipe(recipe_id=int(recipe_ids[row]),
+                                   similar_id=int(recipe_ids[column]),
+                                   score=float(score))
+                     for row, column, score in zip(rows, columns, scores)),
+                    batch_size=options['batch_size'])
+                total += len(rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты: {total} строк для {len(recipe_ids)} рецептов '
+            f'за {time.monotonic() - started:.1f} с.'))
@@ -1,8 +1,10 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 from recipes.validators import validate_not_empty
-from users.models import User
+from users.models import Follow, User
 
 LEN_LIMIT = 20
 
@@ -24,6 +26,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'),
+        ]
+
     def __str__(self):
         return f'{self.name[:LEN_LIMIT]}, {self.measurement_unit}'
 
@@ -55,6 +63,48 @@ class Tag(models.Model):
         return self.name[:LEN_LIMIT]
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для сериализаторов API."""
+
+    def with_user_flags(self, user):
+        """
+        Флаги избранного, корзины и подписки на автора
+        для RecipeReadSerializer. Считаются подзапросами, остальные
+        данные рецепта сериализатор берет из кеша фрагментов.
+        """
+        if user.is_anonymous:
+            false = models.Value(False, output_field=models.BooleanField())
+            return self.annotate(is_favorited=false,
+                                 is_in_shopping_cart=false,
+                                 is_subscribed=false)
+        return self.annotate(
+            is_favorited=models.Exists(Favorites.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_subscribed=models.Exists(Follow.objects.filter(
+                user=user, author=models.OuterRef('author'))))
+
+    def latest_per_author(self, authors, limit=None):
+        """
+        Не более limit последних рецептов каждого из авторов.
+        Номер рецепта внутри автора считается оконной функцией ROW_NUMBER
+        в одном запросе для всех авторов.
+        """
+        queryset = self.filter(author__in=authors)
+        if limit is None:
+            return queryset
+        ranked = queryset.annotate(author_position=models.Window(
+            expression=RowNumber(),
+            partition_by=models.F('author'),
+            order_by=(models.F('pub_date').desc(), models.F('id').desc()),
+        )).values('id', 'author_position')
+        sql, params = ranked.query.get_compiler(self.db).as_sql()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE author_position <= %s',
+            (*params, limit)))
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -97,12 +147,33 @@ class Recipe(models.Model):
         verbose_name='Дата и время публикации рецепта',
         auto_now_add=True,
         db_index=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False)
+    cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False)
+    popularity = models.FloatField(
+        verbose_name='Популярность',
+        default=0,
+        editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-popularity', '-id'],
+                         name='recipe_popularity_id_idx'),
+        ]
+
     def __str__(self):
         return self.name[:LEN_LIMIT]
 
@@ -153,6 +224,12 @@ class TagRecipe(models.Model):
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'recipe'],
+                name='unique_tag_recipe'),
+        ]
+
 
 class Favorites(models.Model):
     """Модель избранных рецептов пользователя."""
@@ -165,6 +242,10 @@ class Favorites(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='favorite_recipe')
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True)
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -191,6 +272,10 @@ class ShoppingCart(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='cart_recipe')
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True)
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -204,3 +289,137 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user}: список покупок'[:LEN_LIMIT]
+
+
+class ShoppingCartTotal(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Поддерживается при изменении корзины и ингредиентов рецептов
+    (recipes.cart), чтобы список покупок читался без агрегации.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_totals')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+        related_name='cart_totals')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_total'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient}'[:LEN_LIMIT]
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожий рецепт и мера сходства по ингредиентам и тегам.
+    Заполняется командой similar_recipes.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='similar_recipes')
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        on_delete=models.CASCADE,
+        related_name='similar_to')
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'),
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='similar_recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'[:LEN_LIMIT]
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписчика автора.
+    Копия даты публикации позволяет читать ленту по индексу
+    (пользователь, дата) без соединения с подписками.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+')
+    pub_date = models.DateTimeField(
+        verbose_name='Дата и время публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'[:LEN_LIMIT]
+
+
+class PopularityState(models.Model):
+    """
+    Состояние пересчета популярности - одна строка.
+    События с created не позже until уже учтены в Recipe.popularity
+    с периодом полураспада half_life. updated - время пересчета,
+    от него зависят ETag и Last-Modified списка по популярности.
+    """
+
+    until = models.DateTimeField(
+        verbose_name='События учтены до')
+    half_life = models.DurationField(
+        verbose_name='Период полураспада')
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Пересчитано')
+
+    class Meta:
+        verbose_name = 'Состояние популярности'
+        verbose_name_plural = 'Состояние популярности'
+
+    def __str__(self):
+        return f'{self.until:%Y-%m-%d %H:%M}'
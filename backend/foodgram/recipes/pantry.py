@@ -0,0 +1,97 @@
+"""
+Подбор рецептов по имеющимся ингредиентам.
+Обратный индекс ингредиент -> отсортированный массив id рецептов
+хранится в памяти процесса и обновляется, когда у рецептов
+меняются наборы ингредиентов (но не количества и не другие поля):
+по строкам измененных рецептов, а если они неизвестны - целиком.
+Ранжирование по покрытию считается без запросов к БД.
+"""
+import heapq
+import itertools
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from recipes.models import IngredientRecipe
+from recipes.versions import VersionedIndex, get_changes
+
+
+def contains(ids, pk):
+    """Есть ли pk в отсортированном массиве ids."""
+    index = bisect_left(ids, pk)
+    return index < len(ids) and ids[index] == pk
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """Рецепты каждого ингредиента и число ингредиентов каждого рецепта."""
+
+    version_name = 'recipe_ingredients'
+
+    def build(self):
+        rows = (IngredientRecipe.objects
+                .order_by('ingredient_id', 'recipe_id')
+                .values_list('ingredient_id', 'recipe_id')
+                .iterator())
+        recipes = {}
+        sizes = Counter()
+        for ingredient_id, group in itertools.groupby(rows, itemgetter(0)):
+            recipes[ingredient_id] = array(
+                'q', (recipe_id for _, recipe_id in group))
+            sizes.update(recipes[ingredient_id])
+        return recipes, sizes
+
+    def update(self, version):
+        """
+        Заменяет строки рецептов, измененных после текущей версии.
+        Измененные массивы копируются: запросы, читающие старые
+        данные, их не увидят.
+        """
+        changes = get_changes(self.version_name, self.version, version)
+        if changes is None:
+            return None
+        recipes, sizes = self.data
+        added = defaultdict(list)
+        for ingredient_id, recipe_id in (
+                IngredientRecipe.objects.filter(recipe__in=changes)
+                .values_list('ingredient_id', 'recipe_id')):
+            added[ingredient_id].append(recipe_id)
+        changed = sorted(changes)
+        touched = set(added).union(
+            ingredient_id for ingredient_id, ids in recipes.items()
+            if any(contains(ids, pk) for pk in changed))
+        recipes = dict(recipes)
+        sizes = sizes.copy()
+        for pk in changed:
+            sizes.pop(pk, None)
+        for ingredient_id in touched:
+            ids = sorted(itertools.chain(
+                (pk for pk in recipes.get(ingredient_id, ())
+                 if pk not in changes),
+                added[ingredient_id]))
+            sizes.update(added[ingredient_id])
+            if ids:
+                recipes[ingredient_id] = array('q', ids)
+            else:
+                recipes.pop(ingredient_id, None)
+        return recipes, sizes
+
+    def rank(self, ingredient_ids, limit):
+        """
+        До limit рецептов, в которых есть хотя бы один из ingredient_ids:
+        [(id рецепта, найдено ингредиентов, всего ингредиентов)].
+        Сначала рецепты с большей долей имеющихся ингредиентов,
+        при равной доле - с большим числом совпадений, затем новые.
+        """
+        recipes, sizes = self.refresh()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(recipes.get(ingredient_id, ()))
+        best = heapq.nlargest(
+            limit, matched.items(),
+            key=lambda item: (item[1] / sizes[item[0]], item[1], item[0]))
+        return [(recipe_id, count, sizes[recipe_id])
+                for recipe_id, count in best]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,79 @@
+"""
+Популярность рецептов с экспоненциальным затуханием по времени.
+Добавление в избранное или корзину в момент t весит
+exp(ln 2 * (t - EPOCH) / период полураспада), а Recipe.popularity
+хранит логарифм суммы весов. Вместо уменьшения всех значений
+со временем растут веса новых событий, поэтому порядок рецептов
+совпадает с порядком по затухающей сумме, а пересчет добавляет
+к значениям только события, появившиеся после прошлого запуска.
+"""
+import itertools
+import math
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import (Favorites, PopularityState, Recipe,
+                            ShoppingCart)
+
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+# Транзакции, начатые раньше, могут зафиксировать события позже:
+# последние минуты остаются до следующего запуска.
+LAG = timedelta(minutes=1)
+EVENTS = (Favorites, ShoppingCart)
+
+
+def log_weight(moment, half_life):
+    return (math.log(2) * (moment - EPOCH).total_seconds()
+            / half_life.total_seconds())
+
+
+def log_add(first, second):
+    """log(exp(first) + exp(second)) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def update_popularity(half_life, full=False, batch_size=1000):
+    """
+    Добавляет к популярности события после прошлого запуска,
+    граница которых хранится в PopularityState.
+    Без сохраненного состояния, при смене периода полураспада
+    или с full пересчитывает с нуля: только так учитываются удаления
+    из избранного и корзины. Возвращает число измененных рецептов.
+    """
+    until = timezone.now() - LAG
+    state = PopularityState.objects.first()
+    full = full or state is None or state.half_life != half_life
+    scores = {}
+    for model in EVENTS:
+        events = model.objects.filter(created__lte=until)
+        if not full:
+            events = events.filter(created__gt=state.until)
+        for recipe_id, created in events.values_list(
+                'recipe_id', 'created').iterator():
+            weight = log_weight(created, half_life)
+            if recipe_id in scores:
+                weight = log_add(scores[recipe_id], weight)
+            scores[recipe_id] = weight
+    with transaction.atomic():
+        if full:
+            Recipe.objects.exclude(popularity=0).update(popularity=0)
+        ids = iter(sorted(scores))
+        while True:
+            batch = list(itertools.islice(ids, batch_size))
+            if not batch:
+                break
+            recipes = list(Recipe.objects.filter(id__in=batch)
+                           .only('id', 'popularity'))
+            for recipe in recipes:
+                # 0 - событий еще не было.
+                recipe.popularity = (
+                    log_add(recipe.popularity, scores[recipe.id])
+                    if recipe.popularity else scores[recipe.id])
+            Recipe.objects.bulk_update(recipes, ['popularity'])
+        PopularityState.objects.update_or_create(
+            pk=1, defaults={'until': until, 'half_life': half_life})
+    return len(scores)
@@ -0,0 +1,105 @@
+"""
+Справочники тегов и ингредиентов в памяти процесса.
+Сериализаторы и фильтры берут из них записи вместо запросов к БД.
+Версии справочников читает RegistryMiddleware в начале запроса,
+поэтому изменения в другом воркере видны со следующего запроса.
+Справочник перестраивается при первом обращении после изменения
+и при обращении к записи, которой в нем еще нет.
+"""
+import threading
+
+from recipes.models import Ingredient, Tag
+from recipes.versions import VersionedIndex, get_versions
+
+
+class Record:
+    """Запись справочника: значения полей из __slots__ по порядку."""
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.id}, {self.name!r})'
+
+
+class TagRecord(Record):
+    __slots__ = ('id', 'name', 'color', 'slug')
+
+
+class IngredientRecord(Record):
+    __slots__ = ('id', 'name', 'measurement_unit')
+
+
+class Registry(VersionedIndex):
+    """Записи модели model {id: запись} в порядке сортировки модели."""
+
+    def __init__(self, version_name, model, record):
+        super().__init__()
+        self.version_name = version_name
+        self.model = model
+        self.record = record
+        # Версия, прочитанная в начале текущего запроса этого потока.
+        self.checked = threading.local()
+
+    def __deepcopy__(self, memo):
+        # Справочник один на процесс: поля DRF копируются вместе с ним.
+        return self
+
+    def build(self):
+        return {values[0]: self.record(*values)
+                for values in self.model.objects.values_list(
+                    *self.record.__slots__)}
+
+    def reload(self):
+        """Перестраивает справочник, не дожидаясь смены версии."""
+        with self.lock:
+            self.data = self.build()
+        return self.data
+
+    def get_many(self, pks):
+        """
+        Записи {id: запись} для id из pks, которые есть в БД.
+        Если id нет в справочнике, но он есть в БД, версия еще не дошла
+        до процесса: справочник перестраивается.
+        """
+        data = self.current()
+        missing = [pk for pk in pks if pk not in data]
+        if missing and self.model.objects.filter(id__in=missing).exists():
+            data = self.reload()
+        return {pk: data[pk] for pk in pks if pk in data}
+
+    def current(self):
+        """
+        Данные версии, прочитанной RegistryMiddleware в начале запроса.
+        Вне запросов версия читается из кеша при каждом обращении.
+        """
+        return self.refresh(getattr(self.checked, 'version', None))
+
+
+tag_registry = Registry('tags', Tag, TagRecord)
+ingredient_registry = Registry('ingredients', Ingredient, IngredientRecord)
+REGISTRIES = (tag_registry, ingredient_registry)
+
+
+class RegistryMiddleware:
+    """
+    Читает версии справочников в начале запроса одним обращением
+    к кешу. Устаревший справочник перестраивается при обращении к нему.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        versions = get_versions(
+            [registry.version_name for registry in REGISTRIES])
+        for registry in REGISTRIES:
+            registry.checked.version = versions[registry.version_name]
+        try:
+            return self.get_response(request)
+        finally:
+            for registry in REGISTRIES:
+                registry.checked.version = None
@@ -0,0 +1,123 @@
+"""
+Поиск ингредиентов и рецептов по названию.
+IngredientIndex ищет в памяти процесса, search_by_name - в БД
+по индексам из SEARCH_INDEXES.
+"""
+import bisect
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import BooleanField, Case, Q, Value, When
+
+from recipes.models import Ingredient
+from recipes.versions import VersionedIndex
+
+# Индексы PostgreSQL для поиска по названию: по префиксу (istartswith),
+# по подстроке (icontains) и нечеткого (trigram_similar).
+# Репозиторий не хранит миграций, поэтому индексы не объявлены через
+# AddIndex/GinIndex: в Meta.indexes они создавались бы и на SQLite,
+# где нет ни text_pattern_ops, ни GIN, а OpClass для индекса
+# по выражению UPPER(name) появился только в Django 4.1. Кроме того,
+# pg_trgm нужно включить до создания триграммных индексов.
+PATTERN_INDEX = ('CREATE INDEX IF NOT EXISTS {table}_name_upper_like '
+                 'ON {table} (UPPER(name::text) text_pattern_ops)')
+TRIGRAM_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS {table}_name_upper_trgm '
+    'ON {table} USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS {table}_name_trgm '
+    'ON {table} USING gin (name gin_trgm_ops)',
+)
+
+trigram_enabled = {}
+
+
+def has_trigram(connection):
+    """Установлено ли расширение pg_trgm в БД соединения."""
+    if connection.vendor != 'postgresql':
+        return False
+    if connection.alias not in trigram_enabled:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            trigram_enabled[connection.alias] = cursor.fetchone() is not None
+    return trigram_enabled[connection.alias]
+
+
+def create_search_indexes(connection, tables):
+    """
+    Создает индексы поиска по названию на PostgreSQL после migrate.
+    Без пакета contrib с pg_trgm остается только индекс по префиксу.
+    Запросы идемпотентны, повторный migrate ничего не меняет.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions "
+                       "WHERE name = 'pg_trgm'")
+        indexes = (PATTERN_INDEX,)
+        if cursor.fetchone() is not None:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            indexes += TRIGRAM_INDEXES
+        for table in tables:
+            for sql in indexes:
+                cursor.execute(sql.format(table=table))
+    trigram_enabled.pop(connection.alias, None)
+
+
+def search_by_name(queryset, query):
+    """
+    Поиск по полю name: сначала совпадения по префиксу, затем по подстроке.
+    На PostgreSQL добавляются нечеткие совпадения, упорядоченные
+    по триграммному сходству. На остальных БД - только по подстроке.
+    """
+    query = query.strip()
+    matches = Q(name__icontains=query)
+    ordering = ()
+    if has_trigram(connections[queryset.db]):
+        matches |= Q(name__trigram_similar=query)
+        queryset = queryset.annotate(
+            similarity=TrigramSimilarity('name', query))
+        ordering = ('-similarity',)
+    return queryset.filter(matches).annotate(
+        is_prefix=Case(When(name__istartswith=query, then=Value(True)),
+                       default=Value(False),
+                       output_field=BooleanField()),
+    ).order_by('-is_prefix', *ordering, 'name')
+
+
+class IngredientIndex(VersionedIndex):
+    """
+    Отсортированный список названий в casefold для поиска по префиксу
+    бинарным поиском. Совпадения по префиксу идут раньше совпадений
+    по подстроке.
+    """
+
+    version_name = 'ingredients'
+
+    def build(self):
+        rows = sorted(
+            (name.casefold(), name, pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'))
+        return (
+            [row[0] for row in rows],
+            [{'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+             for _, name, pk, measurement_unit in rows])
+
+    def search(self, query, limit):
+        keys, items = self.refresh()
+        query = query.strip().casefold()
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + chr(0x10FFFF), start)
+        found = items[start:min(end, start + limit)]
+        if len(found) < limit:
+            for position, key in enumerate(keys):
+                if start <= position < end or query not in key:
+                    continue
+                found.append(items[position])
+                if len(found) == limit:
+                    break
+        return found
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,173 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from recipes.cart import (add_to_cart_totals, adjust_cart_totals,
+                          remove_from_cart_totals)
+from recipes.counters import increment
+from recipes.feed import backfill_feed, fan_out_on_commit, trim_feed
+from recipes.fragments import CARDS_VERSION, recipe_version
+from recipes.models import (Favorites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagRecipe)
+from recipes.search import create_search_indexes
+from recipes.versions import CONTENT_VERSION, bump_version_on_commit
+from users.models import Follow, User
+
+# Счетчики рецепта для связей пользователей с ним.
+RECIPE_COUNTERS = {Favorites: 'favorites_count', ShoppingCart: 'cart_count'}
+# Поля автора в карточке рецепта (AuthorSerializer).
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_version_on_commit('ingredients')
+    bump_version_on_commit(CARDS_VERSION)
+    bump_version_on_commit(CONTENT_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    bump_version_on_commit('tags')
+    bump_version_on_commit(CARDS_VERSION)
+    bump_version_on_commit(CONTENT_VERSION)
+
+
+@receiver(pre_save, sender=User)
+def check_author_fields(instance, update_fields, **kwargs):
+    # У нового пользователя нет рецептов, а вход и счетчики обновляют
+    # поля не из карточки.
+    instance.card_fields_changed = False
+    if instance._state.adding or (
+            update_fields is not None
+            and not set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    instance.card_fields_changed = User.objects.filter(pk=instance.pk).exclude(
+        **{field: getattr(instance, field) for field in AUTHOR_FIELDS}
+    ).exists()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, **kwargs):
+    if not getattr(instance, 'card_fields_changed', False):
+        return
+    for pk in Recipe.objects.filter(author=instance).values_list(
+            'id', flat=True):
+        bump_version_on_commit(recipe_version(pk))
+    bump_version_on_commit(CONTENT_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    bump_version_on_commit(recipe_version(instance.pk))
+    bump_version_on_commit(CONTENT_VERSION)
+
+
+# Обработчики post_delete отключают быстрое каскадное удаление строк,
+# зато строки, удаленные в админке или напрямую, не оставляют
+# устаревших карточек. bulk_create сигналов не вызывает, такие вставки
+# отмечаются в RecipeWriteSerializer.
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=TagRecipe)
+def recipe_part_changed(instance, **kwargs):
+    bump_version_on_commit(recipe_version(instance.recipe_id))
+    bump_version_on_commit(CONTENT_VERSION)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredients_changed(signal, instance, created=False, **kwargs):
+    # Изменение количества не меняет индекс подбора рецептов.
+    if created or signal is post_delete:
+        bump_version_on_commit('recipe_ingredients', [instance.recipe_id])
+
+
+# API меняет связи SQL-запросами в обход сигналов и сам меняет их
+# счетчики, итоги корзин и ленты. Обработчики ниже отвечают за изменения
+# из админки, каскадные и прочие через ORM.
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_link_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        increment(Recipe, instance.recipe_id, RECIPE_COUNTERS[sender])
+
+
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_link_deleted(sender, instance, **kwargs):
+    increment(Recipe, instance.recipe_id, RECIPE_COUNTERS[sender], -1)
+
+
+# Итоги корзины вычитаются после удаления строк: при каскадном
+# удалении рецепта удаленные раньше строки корзины или ингредиентов
+# уже не найдутся, и рецепт вычтется из итогов один раз.
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_deleted(instance, **kwargs):
+    remove_from_cart_totals([instance.recipe_id], instance.user_id)
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def cart_item_changing(instance, **kwargs):
+    if instance._state.adding:
+        return
+    for user_id, recipe_id in ShoppingCart.objects.filter(
+            pk=instance.pk).values_list('user_id', 'recipe_id'):
+        remove_from_cart_totals([recipe_id], user_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_saved(instance, raw, **kwargs):
+    if not raw:
+        add_to_cart_totals([instance.recipe_id], instance.user_id)
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def recipe_ingredient_changing(instance, **kwargs):
+    if instance._state.adding:
+        return
+    for recipe_id, ingredient_id, amount in IngredientRecipe.objects.filter(
+            pk=instance.pk).values_list('recipe_id', 'ingredient_id',
+                                        'amount'):
+        adjust_cart_totals(recipe_id, {ingredient_id: -amount})
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def recipe_ingredient_saved(instance, raw, **kwargs):
+    if not raw:
+        adjust_cart_totals(instance.recipe_id,
+                           {instance.ingredient_id: instance.amount})
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_deleted(instance, **kwargs):
+    adjust_cart_totals(instance.recipe_id,
+                       {instance.ingredient_id: -instance.amount})
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, raw, **kwargs):
+    if created and not raw:
+        increment(User, instance.author_id, 'followers_count')
+        backfill_feed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    increment(User, instance.author_id, 'followers_count', -1)
+    trim_feed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    increment(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, raw, **kwargs):
+    if created and not raw:
+        increment(User, instance.author_id, 'recipes_count')
+        fan_out_on_commit(instance)
+
+
+def search_indexes(sender, using, **kwargs):
+    create_search_indexes(connections[using],
+                          (Ingredient._meta.db_table, Recipe._meta.db_table))
@@ -0,0 +1,71 @@
+"""
+Поиск похожих рецептов по косинусной мере сходства векторов
+ингредиентов и тегов. Матрица рецепты x признаки разреженная,
+top-k считается блоками строк, блоки распределяются по процессам.
+"""
+import numpy as np
+from scipy import sparse
+
+# Наибольшее число ячеек плотного блока сходств (float32).
+CHUNK_CELLS = 16_000_000
+
+matrix = None
+top_k = None
+
+
+def feature_matrix(ingredients, tags, tag_weight):
+    """
+    ingredients и tags - массивы пар (id рецепта, id признака).
+    Возвращает id рецептов и матрицу CSR с нормированными строками:
+    ингредиент дает признаку вес 1, тег - tag_weight.
+    """
+    ingredients = np.asarray(ingredients, dtype=np.int64).reshape(-1, 2)
+    tags = np.asarray(tags, dtype=np.int64).reshape(-1, 2)
+    recipe_ids, rows = np.unique(
+        np.concatenate([ingredients[:, 0], tags[:, 0]]), return_inverse=True)
+    ingredient_ids, ingredient_columns = np.unique(ingredients[:, 1],
+                                                   return_inverse=True)
+    tag_ids, tag_columns = np.unique(tags[:, 1], return_inverse=True)
+    columns = np.concatenate([ingredient_columns,
+                              len(ingredient_ids) + tag_columns])
+    data = np.concatenate([np.ones(len(ingredients), dtype=np.float32),
+                           np.full(len(tags), tag_weight, dtype=np.float32)])
+    features = sparse.csr_matrix(
+        (data, (rows.ravel(), columns.ravel())),
+        shape=(len(recipe_ids), len(ingredient_ids) + len(tag_ids)))
+    features.sum_duplicates()
+    norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)))
+    norms[norms == 0] = 1
+    return recipe_ids, sparse.csr_matrix(
+        sparse.diags(1 / norms.ravel()) @ features, dtype=np.float32)
+
+
+def chunk_size(recipes):
+    return max(1, CHUNK_CELLS // max(recipes, 1))
+
+
+def init_worker(features, k):
+    global matrix, top_k
+    matrix = features
+    top_k = k
+
+
+def nearest(start):
+    """
+    top_k ближайших рецептов для строк блока, начинающегося со start.
+    Возвращает массивы строк, столбцов и сходств (только > 0).
+    """
+    total = matrix.shape[0]
+    end = min(start + chunk_size(total), total)
+    scores = (matrix[start:end] @ matrix.T).toarray()
+    positions = np.arange(end - start)
+    # Рецепт не считается похожим на самого себя.
+    scores[positions, start + positions] = 0
+    k = min(top_k, total - 1)
+    if k <= 0:
+        return (np.empty(0, np.int64),) * 2 + (np.empty(0, np.float32),)
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, columns, axis=1)
+    rows = np.repeat(start + positions, k).reshape(-1, k)
+    found = best > 0
+    return rows[found], columns[found], best[found]
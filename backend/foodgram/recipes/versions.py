@@ -0,0 +1,184 @@
+"""
+Счетчики версий данных в общем кеше Django.
+Процессы сравнивают сохраненную версию с текущей, чтобы понять,
+что данные изменились в другом воркере и локальные копии устарели.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+KEY = 'version:{}'
+MODIFIED_KEY = 'modified:{}'
+CHANGES_KEY = 'changes:{}:{}'
+# Сколько последних изменений набора можно применить к копии
+# вместо того, чтобы строить ее заново, и сколько они хранятся.
+CHANGES_LIMIT = 100
+CHANGES_TIMEOUT = 60 * 60 * 24
+# Версия всех общедоступных данных: рецептов, тегов и ингредиентов.
+CONTENT_VERSION = 'content'
+
+
+def user_version(pk):
+    """Имя версии избранного, корзины и подписок пользователя pk."""
+    return f'user:{pk}'
+
+
+def get_version(name):
+    """Текущая версия набора данных name."""
+    version = cache.get(KEY.format(name))
+    if version is not None:
+        return version
+    # Начальное значение уникально, поэтому вытеснение ключа из кеша
+    # не вернет версию, с которой уже была построена чья-то копия.
+    version = time.time_ns()
+    if cache.add(KEY.format(name), version, timeout=None):
+        return version
+    return cache.get(KEY.format(name), version)
+
+
+def get_versions(names):
+    """Текущие версии наборов names: одно обращение к кешу для всех."""
+    keys = {KEY.format(name): name for name in names}
+    versions = {keys[key]: version
+                for key, version in cache.get_many(keys).items()}
+    for name in names:
+        if name not in versions:
+            versions[name] = get_version(name)
+    return versions
+
+
+def has_version(name):
+    """Есть ли в кеше версия набора name. Ключ не создается."""
+    return cache.get(KEY.format(name)) is not None
+
+
+def get_modified(names):
+    """Время последнего изменения любого из наборов names (unix time)."""
+    keys = [MODIFIED_KEY.format(name) for name in names]
+    modified = cache.get_many(keys)
+    for key in keys:
+        if key not in modified:
+            # Время изменения неизвестно: считается текущим, чтобы
+            # не подтвердить клиенту устаревшие данные.
+            now = time.time()
+            cache.add(key, now, timeout=None)
+            modified[key] = cache.get(key, now)
+    return max(modified.values())
+
+
+def bump_version(name, changes=None):
+    """
+    Отмечает изменение набора данных name.
+    changes - id измененных объектов, если изменение затронуло
+    только их: по ним копии обновляются без полной перестройки.
+    """
+    cache.set(MODIFIED_KEY.format(name), time.time(), timeout=None)
+    try:
+        version = cache.incr(KEY.format(name))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(KEY.format(name), version, timeout=None)
+    else:
+        if changes:
+            cache.set(CHANGES_KEY.format(name, version), sorted(changes),
+                      timeout=CHANGES_TIMEOUT)
+    return version
+
+
+def get_changes(name, since, version):
+    """
+    id объектов, измененных между версиями since и version набора name,
+    или None, если изменения неизвестны и копию надо строить заново.
+    """
+    if not 0 < version - since <= CHANGES_LIMIT:
+        return None
+    keys = [CHANGES_KEY.format(name, number)
+            for number in range(since + 1, version + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return set().union(*found.values())
+
+
+def bump_pending_versions(connection, names):
+    """Повышает версии, собранные за зафиксированную транзакцию."""
+    connection.pending_versions = None, None
+    for name, changes in names.items():
+        bump_version(name, changes)
+
+
+def bump_version_on_commit(name, changes=None):
+    """
+    Отмечает изменение после фиксации текущей транзакции.
+    Каждая версия повышается один раз, сколько бы строк
+    транзакция ни изменила; changes - как в bump_version.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump_version(name, changes)
+        return
+    names, callback = getattr(connection, 'pending_versions', (None, None))
+    # Откат точки сохранения снимает и зарегистрированный в ней
+    # обработчик: тогда версии собираются заново.
+    if not any(item[1] is callback for item in connection.run_on_commit):
+        names = {}
+        callback = partial(bump_pending_versions, connection, names)
+        connection.pending_versions = names, callback
+        transaction.on_commit(callback)
+    if name not in names:
+        names[name] = set(changes) if changes else None
+    elif names[name] is not None:
+        # Изменение без списка объектов требует полной перестройки.
+        if changes:
+            names[name].update(changes)
+        else:
+            names[name] = None
+
+
+class VersionedIndex(ABC):
+    """
+    Данные в памяти процесса, построенные по БД.
+    refresh() обновляет их через update() или перестраивает build(),
+    когда версия набора version_name изменилась.
+    """
+
+    version_name = None
+
+    def __init__(self):
+        self.version = None
+        self.data = None
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def build(self):
+        """Данные, построенные по текущему состоянию БД."""
+
+    def update(self, version):
+        """
+        Данные версии version, полученные из текущих без полной
+        перестройки, или None, если так обновить их нельзя.
+        """
+
+    def refresh(self, version=None):
+        """
+        Возвращает актуальные данные, при необходимости перестроив их.
+        version - уже прочитанная из кеша текущая версия.
+        """
+        if version is None:
+            version = get_version(self.version_name)
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    # Данные заменяются одним присваиванием, поэтому
+                    # параллельные запросы видят либо старую, либо новую
+                    # версию целиком.
+                    data = None
+                    if self.data is not None:
+                        data = self.update(version)
+                    self.data = self.build() if data is None else data
+                    self.version = version
+        return self.data
@@ -0,0 +1,127 @@
+import base64
+import io
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagRecipe)
+from users.models import Follow, User
+
+USERS = 12
+INGREDIENTS = 120
+RECIPES_PER_AUTHOR = 8
+INGREDIENTS_PER_RECIPE = (4, 12)
+TAGS_PER_RECIPE = (1, 3)
+
+
+def make_image():
+    """Картинка PNG 1x1 в base64 для создания рецептов через API."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+IMAGE = make_image()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def next_second(monkeypatch):
+    """
+    Запросы идут в следующей секунде после изменений данных,
+    поэтому в ответах есть Last-Modified.
+    """
+    now = time.time
+    monkeypatch.setattr('api.mixins.time',
+                        SimpleNamespace(time=lambda: now() + 1))
+
+
+@pytest.fixture
+def dataset(db, django_capture_on_commit_callbacks):
+    """
+    Наполнение БД: пользователи, теги, ингредиенты, рецепты,
+    подписки, избранное и корзины. Возвращает словарь с объектами.
+    """
+    # Обработчики фиксации выполняются сразу, как после коммита:
+    # версии, собранные здесь, не копятся до изменений в тестах.
+    with django_capture_on_commit_callbacks(execute=True):
+        return fill_dataset()
+
+
+def fill_dataset():
+    rnd = random.Random(42)
+    User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@foodgram.ru',
+             first_name=f'Имя{i}', last_name=f'Фамилия{i}')
+        for i in range(USERS))
+    users = list(User.objects.order_by('id'))
+    tags = [Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                      ('Обед', '#49B64E', 'lunch'),
+                                      ('Ужин', '#8775D2', 'dinner'))]
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i:03}', measurement_unit='г')
+        for i in range(INGREDIENTS))
+    ingredients = list(Ingredient.objects.all())
+    Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'Рецепт {author.pk}-{i}',
+               text='Описание', image='recipes/test.png',
+               cooking_time=rnd.randint(1, 120))
+        for author in users for i in range(RECIPES_PER_AUTHOR))
+    recipes = list(Recipe.objects.all())
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                         amount=rnd.randint(1, 500))
+        for recipe in recipes
+        for ingredient in rnd.sample(
+            ingredients, rnd.randint(*INGREDIENTS_PER_RECIPE)))
+    TagRecipe.objects.bulk_create(
+        TagRecipe(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in rnd.sample(tags, rnd.randint(*TAGS_PER_RECIPE)))
+    user = users[0]
+    Follow.objects.bulk_create(
+        Follow(user=user, author=author) for author in users[1:])
+    Favorites.objects.bulk_create(
+        Favorites(user=user, recipe=recipe)
+        for recipe in rnd.sample(recipes, 20))
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=recipe)
+        for recipe in rnd.sample(recipes, 10))
+    call_command('recount', stdout=io.StringIO())
+    return {'user': user, 'users': users, 'tags': tags,
+            'ingredients': ingredients, 'recipes': recipes}
+
+
+@pytest.fixture
+def user(dataset):
+    return dataset['user']
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
@@ -0,0 +1,232 @@
+import io
+from datetime import timedelta
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart)
+from users.models import Follow, User
+
+
+@pytest.mark.django_db
+def test_generate_load_data(dataset):
+    call_command('generate_load_data', users=50, recipes=200,
+                 follows_per_user=5, favorites_per_user=5, seed=1,
+                 batch_size=100, stdout=io.StringIO())
+    assert User.objects.filter(username__startswith='load_').count() == 50
+    recipes = Recipe.objects.filter(name__startswith='load_')
+    assert recipes.count() == 200
+    assert IngredientRecipe.objects.filter(recipe__in=recipes).count() >= 600
+    assert Follow.objects.filter(user__username__startswith='load_').exists()
+    assert Favorites.objects.filter(recipe__in=recipes).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', ('ingredients.csv', 'ingredients.json'))
+def test_import_data_is_idempotent(name):
+    path = settings.BASE_DIR.parent.parent / 'data' / name
+    call_command('import_data', str(path), batch_size=500,
+                 stdout=io.StringIO())
+    count = Ingredient.objects.count()
+    assert count == 2188
+    call_command('import_data', str(path), stdout=io.StringIO())
+    assert Ingredient.objects.count() == count
+
+
+def counters():
+    return (list(Recipe.objects.values_list('id', 'favorites_count',
+                                            'cart_count').order_by('id')),
+            list(User.objects.values_list('id', 'recipes_count',
+                                          'followers_count').order_by('id')))
+
+
+@pytest.mark.django_db
+def test_counters_follow_actions_and_recount(user_client, user, dataset):
+    author = dataset['users'][1]
+    recipe = author.recipes.exclude(favorite_recipe__user=user).first()
+    user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    user_client.delete(f'/api/users/{author.id}/subscribe/')
+    user_client.delete(f'/api/recipes/{user.recipes.first().id}/')
+    recipe.refresh_from_db()
+    author.refresh_from_db()
+    user.refresh_from_db()
+    assert recipe.favorites_count == recipe.favorite_recipe.count()
+    assert recipe.cart_count == recipe.cart_recipe.count()
+    assert author.followers_count == author.following.count()
+    assert user.recipes_count == user.recipes.count()
+    expected = counters()
+    Recipe.objects.update(favorites_count=0, cart_count=0)
+    User.objects.update(recipes_count=0, followers_count=0)
+    call_command('recount', stdout=io.StringIO())
+    assert counters() == expected
+
+
+def assert_counters_match():
+    expected = counters()
+    call_command('recount', stdout=io.StringIO())
+    assert counters() == expected
+
+
+@pytest.mark.django_db
+def test_counters_follow_orm_deletes(user_client, user, dataset):
+    # Удаления из админки и каскады идут через ORM, а не через API.
+    Favorites.objects.filter(user=user).first().delete()
+    ShoppingCart.objects.filter(user=user).exclude(
+        recipe__author=user).delete()
+    Follow.objects.filter(user=user).first().delete()
+    user.recipes.first().delete()
+    assert_counters_match()
+    dataset['users'][1].delete()
+    assert_counters_match()
+
+
+@pytest.mark.django_db
+def test_counters_follow_orm_creates(user, dataset):
+    author = dataset['users'][1]
+    recipe = Recipe.objects.exclude(favorite_recipe__user=user).exclude(
+        cart_recipe__user=user).first()
+    Favorites.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    Follow.objects.filter(user=user, author=author).delete()
+    Follow.objects.create(user=user, author=author)
+    Recipe.objects.create(author=user, name='Новый', text='Описание',
+                          cooking_time=1, image='recipes/image.png')
+    assert_counters_match()
+
+
+@pytest.mark.django_db
+def test_counters_do_not_go_below_zero(user_client, user, dataset):
+    author = dataset['users'][1]
+    User.objects.filter(pk=author.pk).update(followers_count=0)
+    response = user_client.delete(f'/api/users/{author.id}/subscribe/')
+    assert response.status_code == 204
+    author.refresh_from_db()
+    assert author.followers_count == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('workers', (1, 2))
+def test_similar_recipes(anon_client, dataset, monkeypatch, workers):
+    # Маленькие блоки, чтобы расчет шел по частям и в нескольких процессах.
+    monkeypatch.setattr('recipes.similar.CHUNK_CELLS', 200)
+    call_command('similar_recipes', top_k=3, workers=workers,
+                 stdout=io.StringIO())
+    recipe = dataset['recipes'][0]
+    ingredients = set(recipe.ingredients.values_list('id', flat=True))
+    tags = set(recipe.tags.values_list('id', flat=True))
+    expected = {}
+    for other in Recipe.objects.exclude(id=recipe.id):
+        other_ingredients = set(other.ingredients.values_list('id', flat=True))
+        other_tags = set(other.tags.values_list('id', flat=True))
+        dot = (len(ingredients & other_ingredients)
+               + 0.25 * len(tags & other_tags))
+        expected[other.id] = dot / (
+            (len(ingredients) + 0.25 * len(tags))
+            * (len(other_ingredients) + 0.25 * len(other_tags))) ** 0.5
+    response = anon_client.get(f'/api/recipes/{recipe.id}/similar/')
+    assert response.status_code == 200
+    scores = [item['score'] for item in response.json()]
+    assert len(scores) == 3
+    assert scores == pytest.approx(
+        sorted(expected.values(), reverse=True)[:3], rel=1e-5)
+    assert anon_client.get('/api/recipes/0/similar/').status_code == 404
+
+
+def popularity():
+    return dict(Recipe.objects.values_list('id', 'popularity'))
+
+
+@pytest.mark.django_db
+def test_popularity(anon_client, dataset, monkeypatch):
+    monkeypatch.setattr('recipes.popularity.LAG', timedelta(0))
+    now = timezone.now()
+    old, new = dataset['recipes'][:2]
+    Favorites.objects.filter(recipe__in=(old, new)).delete()
+    user, other = dataset['users'][:2]
+    # created заполняется при вставке, время событий задается update.
+    for recipe, users, age in ((old, (user, other), timedelta(days=9)),
+                               (new, (user,), timedelta(days=1))):
+        Favorites.objects.bulk_create(
+            Favorites(user=follower, recipe=recipe) for follower in users)
+        Favorites.objects.filter(recipe=recipe).update(created=now - age)
+    call_command('popularity', half_life=72, stdout=io.StringIO())
+    # Два события девятидневной давности весят меньше одного вчерашнего.
+    old.refresh_from_db()
+    new.refresh_from_db()
+    assert new.popularity > old.popularity > 0
+    Favorites.objects.create(user=other, recipe=new)
+    call_command('popularity', half_life=72, stdout=io.StringIO())
+    incremental = popularity()
+    call_command('popularity', half_life=72, full=True,
+                 stdout=io.StringIO())
+    assert popularity() == pytest.approx(incremental)
+    response = anon_client.get('/api/recipes/?ordering=popular&limit=5')
+    assert response.status_code == 200
+    assert [recipe.id for recipe in Recipe.objects.order_by(
+        '-popularity', '-id')[:5]] == [
+            item['id'] for item in response.json()['results']]
+    response = anon_client.get('/api/recipes/?ordering=popular&cursor=')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_popularity_changes_etag(anon_client, dataset):
+    url = '/api/recipes/?ordering=popular'
+    call_command('popularity', stdout=io.StringIO())
+    etag = anon_client.get(url)['ETag']
+    assert anon_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    # Команда работает в другом процессе: до веб-процесса доходит
+    # только состояние в БД.
+    call_command('popularity', stdout=io.StringIO())
+    assert anon_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_response_cache_stats(anon_client):
+    for _ in range(3):
+        anon_client.get('/api/tags/')
+    stdout = io.StringIO()
+    call_command('response_cache', reset=True, stdout=stdout)
+    assert stdout.getvalue().strip() == (
+        'Попадания: 2, промахи: 1, доля попаданий: 66.7%')
+    stdout = io.StringIO()
+    call_command('response_cache', stdout=stdout)
+    assert stdout.getvalue().startswith('Попадания: 0, промахи: 0')
+
+
+@pytest.mark.django_db
+def test_response_cache_stats_endpoint(anon_client, user_client):
+    for _ in range(3):
+        anon_client.get('/api/tags/')
+    assert user_client.get('/api/response_cache/').status_code == 403
+    admin = APIClient()
+    admin.force_authenticate(User.objects.create(
+        username='admin', email='admin@foodgram.ru', is_staff=True))
+    response = admin.get('/api/response_cache/')
+    assert response.status_code == 200
+    assert response.json() == {'hits': 2, 'misses': 1,
+                               'ratio': pytest.approx(2 / 3)}
+    assert admin.post('/api/response_cache/reset/').status_code == 204
+    assert admin.get('/api/response_cache/').json()['misses'] == 0
+
+
+@pytest.mark.django_db
+def test_popularity_is_incremental_across_processes(dataset, monkeypatch):
+    monkeypatch.setattr('recipes.popularity.LAG', timedelta(0))
+    stdout = io.StringIO()
+    call_command('popularity', stdout=stdout)
+    assert not stdout.getvalue().startswith('Популярность обновлена у 0 ')
+    # Следующий запуск - другой процесс с пустым кешем.
+    cache.clear()
+    user = dataset['user']
+    recipe = Recipe.objects.exclude(favorite_recipe__user=user).first()
+    Favorites.objects.create(user=user, recipe=recipe)
+    stdout = io.StringIO()
+    call_command('popularity', stdout=stdout)
+    assert stdout.getvalue().startswith('Популярность обновлена у 1 ')
@@ -0,0 +1,313 @@
+"""
+Бюджет SQL-запросов и времени ответа для эндпоинтов API.
+Тесты падают, если изменение добавляет запросы на каждый объект выдачи
+(N+1) или заметно замедляет эндпоинт.
+"""
+import io
+import itertools
+import os
+import time
+from contextlib import contextmanager
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from recipes.registry import REGISTRIES
+from tests.conftest import IMAGE
+from users.models import User
+
+# Множитель бюджета времени для медленных окружений (CI, отладка).
+TIME_FACTOR = float(os.getenv('BUDGET_TIME_FACTOR', 1))
+SECONDS = 0.5
+
+
+@pytest.fixture(autouse=True)
+def registries(request):
+    """
+    Справочники строятся один раз на процесс после изменения
+    и не входят в бюджет запроса.
+    """
+    if 'dataset' in request.fixturenames:
+        request.getfixturevalue('dataset')
+    for registry in REGISTRIES:
+        registry.refresh()
+
+
+@contextmanager
+def budget(label, queries, seconds=SECONDS):
+    """Проверяет число SQL-запросов и время выполнения блока."""
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+    executed = len(context.captured_queries)
+    assert executed <= queries, (
+        f'{label}: {executed} SQL-запросов при бюджете {queries}:\n'
+        + '\n'.join(query['sql'] for query in context.captured_queries))
+    assert elapsed <= seconds * TIME_FACTOR, (
+        f'{label}: {elapsed:.3f} с при бюджете {seconds} с')
+
+
+def call(client, method, url, queries, seconds=SECONDS, **kwargs):
+    """Выполняет запрос и проверяет число SQL-запросов и время ответа."""
+    with budget(f'{method.upper()} {url}', queries, seconds):
+        return getattr(client, method)(url, format='json', **kwargs)
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return len(context.captured_queries)
+
+
+def recipe_filter_urls():
+    """Все сочетания фильтров RecipeFilters."""
+    params = ('author={author}', 'tags=breakfast&tags=dinner',
+              'is_favorited=1', 'is_in_shopping_cart=1')
+    for size in range(len(params) + 1):
+        for combination in itertools.combinations(params, size):
+            yield '/api/recipes/?' + '&'.join(combination + ('limit=50',))
+
+
+@pytest.mark.django_db
+class TestReadBudget:
+
+    @pytest.mark.parametrize('url', list(recipe_filter_urls()))
+    def test_recipe_list_filters(self, user_client, dataset, url):
+        url = url.format(author=dataset['users'][1].pk)
+        response = call(user_client, 'get', url, queries=6)
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('url,queries', (
+        ('/api/recipes/?limit=50', 5),
+        ('/api/recipes/?cursor=&limit=50', 4),
+        ('/api/recipes/{recipe}/', 5),
+        ('/api/recipes/?ids={ids}', 4),
+        ('/api/recipes/{recipe}/similar/', 1),
+        # Первый запрос строит индекс ингредиентов рецептов.
+        ('/api/recipes/cook/?ingredients={ingredients}&limit=50', 5),
+        ('/api/tags/', 1),
+        ('/api/tags/{tag}/', 1),
+        ('/api/ingredients/', 1),
+        ('/api/ingredients/?name=ингредиент%2001', 1),
+        ('/api/ingredients/{ingredient}/', 1),
+        ('/api/users/?limit=50', 2),
+        ('/api/users/{author}/', 1),
+    ))
+    def test_anonymous(self, anon_client, dataset, url, queries):
+        url = url.format(recipe=dataset['recipes'][0].pk,
+                         ids=','.join(str(recipe.pk)
+                                      for recipe in dataset['recipes'][:50]),
+                         tag=dataset['tags'][0].pk,
+                         ingredient=dataset['ingredients'][0].pk,
+                         ingredients=','.join(
+                             str(ingredient.pk)
+                             for ingredient in dataset['ingredients'][:30]),
+                         author=dataset['users'][1].pk)
+        if '/similar/' in url:
+            # Похожие рецепты рассчитывает команда, а не запрос.
+            call_command('similar_recipes', workers=1, stdout=io.StringIO())
+        response = call(anon_client, 'get', url, queries=queries)
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('url', (
+        '/api/recipes/?limit=50&tags=lunch',
+        '/api/tags/',
+        '/api/ingredients/',
+    ))
+    def test_anonymous_cached(self, anon_client, dataset, url):
+        anon_client.get(url)
+        response = call(anon_client, 'get', url, queries=0)
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('url', (
+        '/api/recipes/?limit=50',
+        '/api/recipes/{recipe}/',
+        '/api/tags/',
+        '/api/ingredients/{ingredient}/',
+    ))
+    def test_not_modified(self, user_client, dataset, url):
+        url = url.format(recipe=dataset['recipes'][0].pk,
+                         ingredient=dataset['ingredients'][0].pk)
+        etag = user_client.get(url)['ETag']
+        response = call(user_client, 'get', url, queries=0,
+                        HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+    @pytest.mark.parametrize('url,queries', (
+        ('/api/recipes/?limit=50', 5),
+        ('/api/recipes/{recipe}/', 5),
+        ('/api/users/?limit=50', 2),
+        ('/api/users/{author}/', 1),
+        ('/api/users/me/', 1),
+        ('/api/users/subscriptions/?limit=50', 3),
+        ('/api/users/subscriptions/?limit=50&recipes_limit=2', 3),
+        ('/api/recipes/download_shopping_cart/', 1),
+        ('/api/recipes/shopping_cart/', 1),
+        ('/api/recipes/feed/?limit=50', 5),
+    ))
+    def test_authenticated(self, user_client, dataset, url, queries):
+        url = url.format(recipe=dataset['recipes'][0].pk,
+                         author=dataset['users'][1].pk)
+        response = call(user_client, 'get', url, queries=queries)
+        assert response.status_code == 200
+
+    def test_response_cache_stats(self, dataset):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(
+            username='admin', email='admin@foodgram.ru', is_staff=True))
+        response = call(client, 'get', '/api/response_cache/', queries=0)
+        assert response.status_code == 200
+
+    def test_cached_recipe_cards(self, user_client, dataset):
+        # Повторная выдача берет рецепты из кеша фрагментов:
+        # остаются COUNT(*) и выборка рецептов с флагами пользователя.
+        user_client.get('/api/recipes/?limit=50')
+        response = call(user_client, 'get', '/api/recipes/?limit=50',
+                        queries=2)
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('url', (
+        '/api/recipes/?limit={limit}',
+        '/api/recipes/?is_favorited=1&limit={limit}',
+        '/api/recipes/?cursor=&limit={limit}',
+        '/api/recipes/feed/?limit={limit}',
+        '/api/users/?limit={limit}',
+        '/api/users/subscriptions/?limit={limit}',
+        '/api/users/subscriptions/?recipes_limit=3&limit={limit}',
+    ))
+    def test_page_size_does_not_change_query_count(self, user_client, url):
+        assert (count_queries(user_client, url.format(limit=2))
+                == count_queries(user_client, url.format(limit=50)))
+
+
+@pytest.mark.django_db
+class TestWriteBudget:
+
+    def recipe_data(self, dataset, count=30):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [tag.pk for tag in dataset['tags']],
+            'ingredients': [{'id': ingredient.pk, 'amount': 10}
+                            for ingredient in dataset['ingredients'][:count]],
+        }
+
+    def own_recipe(self, dataset):
+        return dataset['user'].recipes.first()
+
+    def foreign_recipe(self, dataset, related_name):
+        return (dataset['users'][1].recipes
+                .exclude(**{f'{related_name}__user': dataset['user']})
+                .first())
+
+    def test_recipe_create(self, user_client, dataset):
+        response = call(user_client, 'post', '/api/recipes/', queries=11,
+                        data=self.recipe_data(dataset))
+        assert response.status_code == 201, response.content
+
+    def test_recipe_update(self, user_client, dataset):
+        url = f'/api/recipes/{self.own_recipe(dataset).pk}/'
+        response = call(user_client, 'patch', url, queries=19,
+                        data=self.recipe_data(dataset))
+        assert response.status_code == 200, response.content
+
+    def test_recipe_update_one_amount(self, user_client, dataset):
+        data = self.recipe_data(dataset)
+        response = user_client.post('/api/recipes/', data, format='json')
+        assert response.status_code == 201, response.content
+        data['ingredients'][0]['amount'] += 1
+        url = f'/api/recipes/{response.data["id"]}/'
+        response = call(user_client, 'patch', url, queries=11, data=data)
+        assert response.status_code == 200, response.content
+
+    def test_recipe_delete(self, user_client, dataset):
+        url = f'/api/recipes/{self.own_recipe(dataset).pk}/'
+        response = call(user_client, 'delete', url, queries=18)
+        assert response.status_code == 204
+
+    @pytest.mark.parametrize('related_name,action,post,delete', (
+        ('favorite_recipe', 'favorite', 5, 4),
+        ('cart_recipe', 'shopping_cart', 6, 6),
+    ))
+    def test_recipe_toggle(self, user_client, dataset, related_name, action,
+                           post, delete):
+        url = (f'/api/recipes/'
+               f'{self.foreign_recipe(dataset, related_name).pk}/{action}/')
+        response = call(user_client, 'post', url, queries=post)
+        assert response.status_code == 201, response.content
+        response = call(user_client, 'delete', url, queries=delete)
+        assert response.status_code == 204
+
+    @pytest.mark.parametrize('action,add,remove', (
+        ('favorite', 5, 4),
+        ('shopping_cart', 6, 6),
+    ))
+    def test_recipe_batch(self, user_client, dataset, action, add, remove):
+        ids = list(Recipe.objects.values_list('id', flat=True)[:50])
+        url = f'/api/recipes/{action}/batch/'
+        response = call(user_client, 'post', url, queries=add,
+                        data={'add': ids})
+        assert response.status_code == 200, response.content
+        response = call(user_client, 'post', url, queries=remove,
+                        data={'remove': ids})
+        assert response.status_code == 200, response.content
+
+    def test_subscribe(self, user_client, dataset):
+        url = f'/api/users/{dataset["users"][1].pk}/subscribe/'
+        response = call(user_client, 'delete', url, queries=5)
+        assert response.status_code == 204
+        response = call(user_client, 'post', url, queries=7)
+        assert response.status_code == 201, response.content
+
+    def test_subscribe_batch(self, user_client, dataset):
+        ids = [user.pk for user in dataset['users'][1:]]
+        url = '/api/users/subscribe/batch/'
+        response = call(user_client, 'post', url, queries=5,
+                        data={'remove': ids})
+        assert response.status_code == 200, response.content
+        response = call(user_client, 'post', url, queries=6,
+                        data={'add': ids})
+        assert response.status_code == 200, response.content
+
+    def test_register(self, anon_client, dataset):
+        response = call(anon_client, 'post', '/api/users/', queries=5,
+                        data={'email': 'new@foodgram.ru',
+                              'username': 'new_user',
+                              'first_name': 'Имя', 'last_name': 'Фамилия',
+                              'password': 'password-123'})
+        assert response.status_code == 201, response.content
+
+    def test_set_password(self, dataset):
+        user = dataset['user']
+        user.set_password('old-password-123')
+        user.save()
+        client = APIClient()
+        client.force_authenticate(user)
+        response = call(client, 'post', '/api/users/set_password/',
+                        queries=3,
+                        data={'current_password': 'old-password-123',
+                              'new_password': 'new-password-456'})
+        assert response.status_code == 204, response.content
+
+    def test_token_login_logout(self, anon_client, dataset):
+        user = dataset['user']
+        user.set_password('password-123')
+        user.save()
+        response = call(anon_client, 'post', '/api/auth/token/login/',
+                        queries=6,
+                        data={'email': user.email,
+                              'password': 'password-123'})
+        assert response.status_code == 200, response.content
+        anon_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}')
+        response = call(anon_client, 'post', '/api/auth/token/logout/',
+                        queries=3)
+        assert response.status_code == 204
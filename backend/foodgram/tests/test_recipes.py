@@ -0,0 +1,664 @@
+import csv
+import io
+import json
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.feed import fan_out
+from recipes.fragments import LRUCache, recipe_version
+from recipes.models import (FeedEntry, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.pantry import recipe_ingredient_index
+from recipes.registry import REGISTRIES, tag_registry
+from recipes.versions import get_version, has_version
+from tests.conftest import IMAGE
+from users.models import Follow
+
+
+def test_cursor_pagination_walks_all_recipes(anon_client, dataset):
+    # Половина рецептов с одинаковой датой: порядок задает id.
+    Recipe.objects.filter(id__in=[recipe.id for recipe in
+                                  dataset['recipes'][::2]]).update(
+        pub_date=timezone.now())
+    expected = list(Recipe.objects.order_by('-pub_date', '-id')
+                    .values_list('id', flat=True))
+    found = []
+    url = '/api/recipes/?cursor=&limit=7'
+    while url:
+        response = anon_client.get(url)
+        assert response.status_code == 200
+        assert 'count' not in response.json()
+        found += [recipe['id'] for recipe in response.json()['results']]
+        url = response.json()['next']
+    assert found == expected
+
+
+@pytest.mark.parametrize('cursor', ('garbage', 'MjAyMHwx'))
+def test_invalid_cursor(anon_client, dataset, cursor):
+    response = anon_client.get('/api/recipes/', {'cursor': cursor})
+    assert response.status_code == 404
+
+
+def test_page_number_pagination_is_default(anon_client, dataset):
+    response = anon_client.get('/api/recipes/', {'limit': 5, 'page': 2})
+    assert response.status_code == 200
+    assert response.json()['count'] == len(dataset['recipes'])
+
+
+def download(client, file_format=None):
+    params = {'format': file_format} if file_format else {}
+    response = client.get('/api/recipes/download_shopping_cart/', params)
+    assert response.status_code == 200
+    assert response.streaming
+    return b''.join(response.streaming_content)
+
+
+def expected_cart(user):
+    totals = {}
+    for recipe in Recipe.objects.filter(cart_recipe__user=user):
+        for item in recipe.recipes.select_related('ingredient'):
+            key = (item.ingredient.name, item.ingredient.measurement_unit)
+            totals[key] = totals.get(key, 0) + item.amount
+    return sorted((name, amount, unit)
+                  for (name, unit), amount in totals.items())
+
+
+def test_download_shopping_cart_txt(user_client, user):
+    lines = download(user_client).decode().split('\n')
+    assert lines[0] == 'Cписок покупок:'
+    assert lines[1:] == ['{} - {} {}.'.format(*item)
+                         for item in expected_cart(user)]
+
+
+def test_download_shopping_cart_csv(user_client, user):
+    rows = list(csv.reader(io.StringIO(download(user_client, 'csv')
+                                       .decode())))
+    assert rows[0] == ['name', 'amount', 'measurement_unit']
+    assert rows[1:] == [[name, str(amount), unit]
+                        for name, amount, unit in expected_cart(user)]
+
+
+def test_download_shopping_cart_json(user_client, user):
+    data = json.loads(download(user_client, 'json'))
+    assert [(item['name'], item['amount'], item['measurement_unit'])
+            for item in data] == expected_cart(user)
+
+
+def test_download_shopping_cart_pdf(user_client, user):
+    content = download(user_client, 'pdf')
+    assert content.startswith(b'%PDF-1.4')
+    assert content.endswith(b'%%EOF\n')
+    offset = int(content.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+    assert content[offset:].startswith(b'xref')
+
+
+@pytest.mark.parametrize('file_format', ('txt', 'csv', 'json', 'pdf'))
+def test_download_shopping_cart_errors_are_json(anon_client, file_format):
+    response = anon_client.get('/api/recipes/download_shopping_cart/',
+                               {'format': file_format})
+    assert response.status_code == 401
+    assert response['Content-Type'] == 'application/json'
+    assert 'detail' in response.json()
+
+
+def test_download_empty_shopping_cart(user_client, user):
+    user.cart_user.all().delete()
+    assert json.loads(download(user_client, 'json')) == []
+    assert download(user_client, 'pdf').endswith(b'%%EOF\n')
+
+
+def cart_summary(client):
+    response = client.get('/api/recipes/shopping_cart/')
+    assert response.status_code == 200
+    return sorted((item['name'], item['amount'], item['measurement_unit'])
+                  for item in response.json())
+
+
+def test_cart_totals_follow_cart_changes(user_client, user, dataset):
+    assert cart_summary(user_client) == expected_cart(user)
+    recipe = (Recipe.objects.exclude(cart_recipe__user=user)
+              .filter(recipes__ingredient__cart_totals__user=user).first())
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert cart_summary(user_client) == expected_cart(user)
+    removed = user.cart_user.first().recipe_id
+    user_client.delete(f'/api/recipes/{removed}/shopping_cart/')
+    assert cart_summary(user_client) == expected_cart(user)
+
+
+def test_cart_totals_follow_recipe_changes(user_client, user, dataset):
+    recipe = user.recipes.first()
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    response = user_client.patch(f'/api/recipes/{recipe.id}/', {
+        'name': recipe.name, 'text': recipe.text, 'cooking_time': 5,
+        'image': IMAGE, 'tags': [dataset['tags'][0].id],
+        'ingredients': [{'id': ingredient.id, 'amount': 7}
+                        for ingredient in dataset['ingredients'][:3]],
+    }, format='json')
+    assert response.status_code == 200, response.content
+    assert cart_summary(user_client) == expected_cart(user)
+    user_client.delete(f'/api/recipes/{recipe.id}/')
+    assert cart_summary(user_client) == expected_cart(user)
+
+
+def test_cart_totals_follow_orm_changes(user_client, user, dataset):
+    # Изменения из админки и каскадные удаления идут через ORM.
+    item = user.cart_user.first()
+    item.delete()
+    assert cart_summary(user_client) == expected_cart(user)
+    recipe = Recipe.objects.exclude(cart_recipe__user=user).first()
+    item = ShoppingCart.objects.create(user=user, recipe=recipe)
+    assert cart_summary(user_client) == expected_cart(user)
+    other = dataset['users'][1]
+    item.user = other
+    item.save()
+    assert cart_summary(user_client) == expected_cart(user)
+    client = APIClient()
+    client.force_authenticate(other)
+    assert cart_summary(client) == expected_cart(other)
+    user.cart_user.first().recipe.delete()
+    assert cart_summary(user_client) == expected_cart(user)
+
+
+def test_cart_totals_follow_orm_ingredient_changes(user_client, user,
+                                                   dataset):
+    # Ингредиенты рецепта меняются в админке строками IngredientRecipe.
+    recipe = user.cart_user.first().recipe
+    item = recipe.recipes.first()
+    item.amount += 5
+    item.save()
+    assert cart_summary(user_client) == expected_cart(user)
+    IngredientRecipe.objects.create(
+        recipe=recipe, ingredient=Ingredient.objects.exclude(
+            recipes=recipe).first(), amount=2)
+    assert cart_summary(user_client) == expected_cart(user)
+    recipe.recipes.first().delete()
+    assert cart_summary(user_client) == expected_cart(user)
+    # Каскад удаляет и строки корзин, и ингредиенты: вычитается один раз.
+    user.cart_user.exclude(recipe__author=user).first().recipe.author.delete()
+    assert cart_summary(user_client) == expected_cart(user)
+
+
+def test_unknown_ingredient_is_rejected(user_client, user, dataset):
+    recipe = user.recipes.first()
+    response = user_client.patch(f'/api/recipes/{recipe.id}/', {
+        'name': recipe.name, 'text': recipe.text, 'cooking_time': 5,
+        'image': IMAGE, 'tags': [dataset['tags'][0].id],
+        'ingredients': [{'id': 10 ** 6, 'amount': 7}],
+    }, format='json')
+    assert response.status_code == 400
+    assert recipe.recipes.exists()
+
+
+@pytest.mark.parametrize('action', ('favorite', 'shopping_cart'))
+def test_recipe_toggle_errors(user_client, dataset, action):
+    recipe = dataset['users'][1].recipes.first()
+    url = f'/api/recipes/{recipe.id}/{action}/'
+    user_client.delete(url)
+    assert user_client.delete(url).status_code == 400
+    assert user_client.post(url).status_code == 201
+    assert user_client.post(url).status_code == 400
+    assert user_client.post(f'/api/recipes/0/{action}/').status_code == 404
+    assert user_client.delete(f'/api/recipes/0/{action}/').status_code == 404
+
+
+def test_shopping_cart_batch(user_client, user, dataset):
+    in_cart = list(user.cart_user.values_list('recipe', flat=True)[:3])
+    new = list(Recipe.objects.exclude(cart_recipe__user=user)
+               .values_list('id', flat=True)[:4])
+    response = user_client.post('/api/recipes/shopping_cart/batch/', {
+        'add': new + in_cart[:1] + [10 ** 6],
+        'remove': in_cart[1:] + [new[0] + 10 ** 6],
+    }, format='json')
+    assert response.status_code == 200, response.content
+    assert response.json() == {
+        'add': ([{'id': pk, 'status': 'added'} for pk in new]
+                + [{'id': in_cart[0], 'status': 'exists'},
+                   {'id': 10 ** 6, 'status': 'invalid'}]),
+        'remove': ([{'id': pk, 'status': 'removed'} for pk in in_cart[1:]]
+                   + [{'id': new[0] + 10 ** 6, 'status': 'absent'}]),
+    }
+    assert cart_summary(user_client) == expected_cart(user)
+    for recipe in Recipe.objects.filter(id__in=new + in_cart):
+        assert recipe.cart_count == recipe.cart_recipe.count()
+
+
+@pytest.mark.parametrize('data', (
+    {}, {'add': [1], 'remove': [1]}, {'add': ['x']},
+    {'add': list(range(1, 102))},
+))
+def test_batch_validation(user_client, data):
+    response = user_client.post('/api/recipes/favorite/batch/', data,
+                                format='json')
+    assert response.status_code == 400
+
+
+def test_recipes_by_ids(user_client, user, dataset):
+    ids = [recipe.id for recipe in dataset['recipes'][10:3:-2]]
+    favorited = set(user.favorite_user.values_list('recipe', flat=True))
+    response = user_client.get(
+        '/api/recipes/', {'ids': ','.join(map(str, ids + [10 ** 6, ids[0]]))})
+    assert response.status_code == 200
+    assert [recipe['id'] for recipe in response.json()] == ids
+    for recipe in response.json():
+        assert recipe['is_favorited'] is (recipe['id'] in favorited)
+
+
+@pytest.mark.parametrize('ids', ('', '1,x', ','.join(['1'] * 101)))
+def test_recipes_by_ids_validation(anon_client, ids):
+    assert anon_client.get('/api/recipes/', {'ids': ids}).status_code == 400
+
+
+@pytest.mark.parametrize('mode', ('any', 'all'))
+def test_tags_filter_modes(anon_client, dataset, mode):
+    slugs = {'breakfast', 'dinner'}
+    expected = set()
+    for recipe in Recipe.objects.prefetch_related('tags'):
+        found = slugs & {tag.slug for tag in recipe.tags.all()}
+        if found == slugs if mode == 'all' else found:
+            expected.add(recipe.id)
+    response = anon_client.get('/api/recipes/', {
+        'tags': sorted(slugs), 'tags_mode': mode, 'limit': 1000})
+    assert response.status_code == 200
+    ids = [recipe['id'] for recipe in response.json()['results']]
+    assert len(ids) == len(set(ids)) == response.json()['count']
+    assert set(ids) == expected
+
+
+def cook(client, ingredients, **params):
+    response = client.get('/api/recipes/cook/', {
+        'ingredients': ','.join(map(str, ingredients)), **params})
+    assert response.status_code == 200, response.content
+    return response.json()
+
+
+def test_cook_ranks_by_coverage(user_client, dataset):
+    recipe = dataset['recipes'][5]
+    have = list(recipe.recipes.values_list('ingredient', flat=True))
+    found = cook(user_client, have[1:], limit=100)
+    coverage = [item['matched'] / item['total'] for item in found]
+    assert coverage == sorted(coverage, reverse=True)
+    item, = [item for item in found if item['id'] == recipe.id]
+    assert (item['matched'], item['total']) == (len(have) - 1, len(have))
+    assert [ingredient['id'] for ingredient in item['missing']] == have[:1]
+    expected = set(Recipe.objects.filter(
+        recipes__ingredient__in=have[1:]).values_list('id', flat=True))
+    assert {item['id'] for item in found} == expected
+
+
+def test_cook_follows_recipe_changes(user_client, user, dataset,
+                                     django_capture_on_commit_callbacks):
+    ingredient = dataset['ingredients'][-1]
+    recipe = user.recipes.exclude(recipes__ingredient=ingredient).first()
+    assert recipe.id not in {item['id']
+                             for item in cook(user_client, [ingredient.id])}
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': recipe.name, 'text': recipe.text, 'cooking_time': 5,
+            'image': IMAGE, 'tags': [dataset['tags'][0].id],
+            'ingredients': [{'id': ingredient.id, 'amount': 7}],
+        }, format='json')
+    assert response.status_code == 200, response.content
+    item = cook(user_client, [ingredient.id])[0]
+    assert (item['id'], item['matched'], item['total']) == (recipe.id, 1, 1)
+
+
+def test_cook_index_applies_recipe_changes(
+        user_client, user, dataset, django_capture_on_commit_callbacks,
+        monkeypatch):
+    ingredient = dataset['ingredients'][-1]
+    cook(user_client, [ingredient.id])
+    recipe, removed = user.recipes.all()[:2]
+    data = {'name': recipe.name, 'text': recipe.text, 'cooking_time': 5,
+            'image': IMAGE, 'tags': [dataset['tags'][0].id],
+            'ingredients': [{'id': ingredient.id, 'amount': 7}]}
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.patch(f'/api/recipes/{recipe.id}/', data, format='json')
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.delete(f'/api/recipes/{removed.id}/')
+    data['name'] = 'Новый рецепт'
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.post('/api/recipes/', data, format='json')
+    assert response.status_code == 201, response.content
+    # Изменения применяются по строкам измененных рецептов.
+    build = recipe_ingredient_index.build
+    monkeypatch.setattr(recipe_ingredient_index, 'build', None)
+    found = {item['id'] for item in cook(user_client, [ingredient.id])}
+    assert {recipe.id, response.data['id']} <= found
+    assert removed.id not in found
+    assert recipe_ingredient_index.data == build()
+
+
+def test_cook_index_ignores_other_recipe_changes(
+        user_client, user, dataset, django_capture_on_commit_callbacks):
+    recipe = user.recipes.first()
+    data = {'name': 'Новое название', 'text': recipe.text,
+            'cooking_time': 5, 'image': IMAGE,
+            'tags': [dataset['tags'][0].id],
+            'ingredients': [{'id': item.ingredient_id, 'amount': 99}
+                            for item in recipe.recipes.all()]}
+    version = get_version('recipe_ingredients')
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.patch(f'/api/recipes/{recipe.id}/', data,
+                                     format='json')
+    assert response.status_code == 200, response.content
+    assert get_version('recipe_ingredients') == version
+    data['ingredients'] = data['ingredients'][1:]
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.patch(f'/api/recipes/{recipe.id}/', data, format='json')
+    assert get_version('recipe_ingredients') != version
+
+
+@pytest.mark.parametrize('params', (
+    {'ingredients': ''}, {'ingredients': '1,x'},
+    {'ingredients': '1', 'limit': 0}, {'ingredients': '1', 'limit': 'all'},
+))
+def test_cook_validation(anon_client, params):
+    response = anon_client.get('/api/recipes/cook/', params)
+    assert response.status_code == 400
+
+
+def feed(client):
+    found = []
+    url = '/api/recipes/feed/?limit=7'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.content
+        found += [recipe['id'] for recipe in response.json()['results']]
+        url = response.json()['next']
+    return found
+
+
+def expected_feed(user):
+    return list(Recipe.objects.filter(author__following__user=user)
+                .order_by('-pub_date', '-id').values_list('id', flat=True))
+
+
+def test_feed_follows_subscriptions(user_client, user, dataset):
+    assert feed(user_client) == expected_feed(user) != []
+    author = dataset['users'][2]
+    user_client.delete(f'/api/users/{author.id}/subscribe/')
+    assert feed(user_client) == expected_feed(user)
+    assert not set(feed(user_client)) & set(
+        author.recipes.values_list('id', flat=True))
+    user_client.post('/api/users/subscribe/batch/', {'add': [author.id]},
+                     format='json')
+    assert feed(user_client) == expected_feed(user)
+
+
+def test_feed_follows_orm_subscriptions(user_client, user, dataset):
+    # Подписки из админки идут через ORM, а не через API.
+    author = dataset['users'][2]
+    Follow.objects.filter(user=user, author=author).delete()
+    assert feed(user_client) == expected_feed(user)
+    Follow.objects.create(user=user, author=author)
+    assert feed(user_client) == expected_feed(user)
+    assert set(feed(user_client)) & set(
+        author.recipes.values_list('id', flat=True))
+
+
+def test_feed_receives_new_recipes(user_client, user, dataset,
+                                   django_capture_on_commit_callbacks):
+    author = dataset['users'][3]
+    client = APIClient()
+    client.force_authenticate(author)
+    with django_capture_on_commit_callbacks() as callbacks:
+        response = client.post('/api/recipes/', {
+            'name': 'Новинка', 'text': 'Описание', 'cooking_time': 5,
+            'image': IMAGE, 'tags': [dataset['tags'][0].id],
+            'ingredients': [{'id': dataset['ingredients'][0].id,
+                             'amount': 1}],
+        }, format='json')
+    assert response.status_code == 201, response.content
+    # До фиксации создания рецепта ленты не меняются.
+    assert feed(user_client)[0] != response.data['id']
+    for callback in callbacks:
+        callback()
+    assert feed(user_client)[0] == response.data['id']
+    assert feed(client) == []
+    client.delete(f'/api/recipes/{response.data["id"]}/')
+    assert feed(user_client) == expected_feed(user)
+
+
+def test_fan_out_in_batches(dataset):
+    recipe = dataset['recipes'][0]
+    Follow.objects.bulk_create(
+        (Follow(user=user, author=recipe.author)
+         for user in dataset['users'] if user != recipe.author),
+        ignore_conflicts=True)
+    followers = set(Follow.objects.filter(
+        author=recipe.author).values_list('user_id', flat=True))
+    FeedEntry.objects.filter(recipe=recipe).delete()
+    fan_out(recipe.id, recipe.author_id, batch_size=2)
+    assert set(FeedEntry.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True)) == followers
+
+
+def test_recipe_cards_merge_user_flags(anon_client, user_client, user,
+                                       dataset):
+    recipe = user.favorite_user.first().recipe
+    url = f'/api/recipes/{recipe.id}/'
+    cached = anon_client.get(url).json()
+    assert (cached['is_favorited'], cached['author']['is_subscribed']) == (
+        False, False)
+    data = user_client.get(url).json()
+    assert data['is_favorited'] is True
+    assert data['is_in_shopping_cart'] is user.cart_user.filter(
+        recipe=recipe).exists()
+    assert data['author']['is_subscribed'] is user.follower.filter(
+        author=recipe.author).exists()
+    assert data['image'].startswith('http://testserver/media/')
+    assert {key: value for key, value in data.items()
+            if key not in ('author', 'is_favorited', 'is_in_shopping_cart')
+            } == {key: value for key, value in cached.items()
+                  if key not in ('author', 'is_favorited',
+                                 'is_in_shopping_cart')}
+
+
+def test_recipe_cards_follow_changes(anon_client, user_client, user,
+                                     dataset,
+                                     django_capture_on_commit_callbacks):
+    recipe = user.recipes.first()
+    url = f'/api/recipes/{recipe.id}/'
+    anon_client.get(url)
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.patch(url, {
+            'name': 'Новое название', 'text': recipe.text, 'cooking_time': 5,
+            'image': IMAGE, 'tags': [dataset['tags'][0].id],
+            'ingredients': [{'id': dataset['ingredients'][0].id,
+                             'amount': 3}],
+        }, format='json')
+    data = anon_client.get(url).json()
+    assert data['name'] == 'Новое название'
+    assert [item['amount'] for item in data['ingredients']] == [3]
+    tag = dataset['tags'][0]
+    tag.name = 'Бранч'
+    with django_capture_on_commit_callbacks(execute=True):
+        tag.save()
+    assert anon_client.get(url).json()['tags'][0]['name'] == 'Бранч'
+
+
+def test_recipe_cards_follow_direct_deletes(
+        anon_client, user, dataset, django_capture_on_commit_callbacks):
+    recipe = user.recipes.first()
+    url = f'/api/recipes/{recipe.id}/'
+    ingredients = len(anon_client.get(url).json()['ingredients'])
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe.recipes.first().delete()
+    assert len(anon_client.get(url).json()['ingredients']) == ingredients - 1
+
+
+def test_recipe_cards_follow_author_changes(
+        anon_client, user, dataset, django_capture_on_commit_callbacks):
+    recipe = user.recipes.first()
+    other = Recipe.objects.exclude(author=user).first()
+    versions = {pk: get_version(recipe_version(pk))
+                for pk in (recipe.id, other.id)}
+    with django_capture_on_commit_callbacks(execute=True):
+        user.save(update_fields=('last_login',))
+        user.save()
+    assert get_version(recipe_version(recipe.id)) == versions[recipe.id]
+    user.first_name = 'Новое имя'
+    with django_capture_on_commit_callbacks(execute=True):
+        user.save()
+    assert get_version(recipe_version(recipe.id)) != versions[recipe.id]
+    assert get_version(recipe_version(other.id)) == versions[other.id]
+    data = anon_client.get(f'/api/recipes/{recipe.id}/').json()
+    assert data['author']['first_name'] == 'Новое имя'
+
+
+def test_versions_are_bumped_once_per_transaction(
+        user_client, user, dataset, django_capture_on_commit_callbacks,
+        monkeypatch):
+    bumped = []
+    monkeypatch.setattr('recipes.versions.bump_version',
+                        lambda name, changes=None: bumped.append(name))
+    recipe = user.recipes.first()
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        response = user_client.delete(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 204
+    assert len(callbacks) == 1
+    assert sorted(bumped) == sorted(set(bumped))
+    assert {recipe_version(recipe.id), 'recipe_ingredients'} <= set(bumped)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LRUCache(2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+
+
+def test_anonymous_response_cache(anon_client, user_client, dataset,
+                                  django_capture_on_commit_callbacks):
+    url = '/api/recipes/?tags=dinner&tags=breakfast&limit=5'
+    first = anon_client.get(url)
+    assert first['X-Cache'] == 'MISS'
+    second = anon_client.get('/api/recipes/?limit=5&tags=breakfast'
+                             '&tags=dinner')
+    assert second['X-Cache'] == 'HIT'
+    assert second.json() == first.json()
+    # Другие параметры и авторизованные запросы идут мимо кеша.
+    assert 'X-Cache' not in anon_client.get(url + '&tags_mode=all')
+    assert 'X-Cache' not in user_client.get(url)
+    tag = dataset['tags'][2]
+    tag.name = 'Поздний ужин'
+    with django_capture_on_commit_callbacks(execute=True):
+        tag.save()
+    response = anon_client.get(url)
+    assert response['X-Cache'] == 'MISS'
+    assert 'Поздний ужин' in {
+        item['name'] for recipe in response.json()['results']
+        for item in recipe['tags']}
+    assert anon_client.get('/api/tags/')['X-Cache'] == 'MISS'
+    assert anon_client.get('/api/tags/')['X-Cache'] == 'HIT'
+
+
+@pytest.mark.parametrize('url', ('/api/recipes/?limit=5', '/api/tags/',
+                                 '/api/ingredients/'))
+def test_conditional_get(anon_client, dataset, next_second, url):
+    response = anon_client.get(url)
+    assert response.status_code == 200
+    etag, last_modified = response['ETag'], response['Last-Modified']
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    response = anon_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 304
+    response = anon_client.get(url + ('&' if '?' in url else '?')
+                               + 'page=2', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+def test_conditional_get_follows_changes(user_client, user, dataset,
+                                         django_capture_on_commit_callbacks,
+                                         next_second):
+    recipe = user.recipes.first()
+    url = f'/api/recipes/{recipe.id}/'
+    etag = user_client.get(url)['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.post(f'{url}shopping_cart/')
+    response = user_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()['is_in_shopping_cart'] is True
+    etag = response['ETag']
+    assert user_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    tag = dataset['tags'][0]
+    tag.color = '#000000'
+    with django_capture_on_commit_callbacks(execute=True):
+        tag.save()
+    assert user_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+def test_conditional_get_skips_current_second(
+        anon_client, dataset, django_capture_on_commit_callbacks):
+    recipe = dataset['recipes'][0]
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe.save()
+    response = anon_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 200
+    assert 'ETag' in response
+    assert 'Last-Modified' not in response
+
+
+@pytest.mark.parametrize('pk', ('abc', '007x', 10 ** 6))
+def test_conditional_get_skips_unknown_recipes(anon_client, dataset, pk):
+    response = anon_client.get(f'/api/recipes/{pk}/')
+    assert response.status_code == 404
+    assert 'ETag' not in response
+    assert not has_version(recipe_version(pk))
+
+
+def test_registry_follows_tag_changes(anon_client, user_client, dataset,
+                                      django_capture_on_commit_callbacks):
+    url = '/api/recipes/?tags=brunch'
+    assert anon_client.get(url).status_code == 400
+    data = {'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'image': IMAGE, 'tags': [10 ** 6],
+            'ingredients': [{'id': dataset['ingredients'][0].id,
+                             'amount': 1}]}
+    response = user_client.post('/api/recipes/', data, format='json')
+    assert response.status_code == 400
+    assert 'tags' in response.json()
+    with django_capture_on_commit_callbacks(execute=True):
+        tag = Tag.objects.create(name='Бранч', color='#FFFFFF',
+                                 slug='brunch')
+    assert not hasattr(tag_registry.current()[tag.id], '__dict__')
+    assert anon_client.get(url).json()['count'] == 0
+    data['tags'] = [tag.id]
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.post('/api/recipes/', data, format='json')
+    assert response.status_code == 201, response.content
+    assert response.json()['tags'][0]['slug'] == 'brunch'
+    assert anon_client.get(url).json()['count'] == 1
+
+
+def test_registry_finds_records_created_elsewhere(anon_client, user_client,
+                                                  user, dataset):
+    # bulk_create не вызывает сигналы: так выглядит запись, созданная
+    # в другом процессе, версия которой еще не дошла до этого.
+    for registry in REGISTRIES:
+        registry.refresh()
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='шафран', measurement_unit='г')])
+    Tag.objects.bulk_create(
+        [Tag(name='Бранч', color='#FFFFFF', slug='brunch')])
+    ingredient = Ingredient.objects.get(name='шафран')
+    tag = Tag.objects.get(slug='brunch')
+    recipe = user.recipes.first()
+    IngredientRecipe.objects.create(recipe=recipe, ingredient=ingredient,
+                                    amount=3)
+    response = anon_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 200
+    assert {'id': ingredient.id, 'name': 'шафран', 'measurement_unit': 'г',
+            'amount': 3} in response.json()['ingredients']
+    response = user_client.post('/api/recipes/', {
+        'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+        'image': IMAGE, 'tags': [tag.id],
+        'ingredients': [{'id': ingredient.id, 'amount': 1}],
+    }, format='json')
+    assert response.status_code == 201, response.content
+    assert anon_client.get('/api/recipes/?tags=brunch').json()['count'] == 1
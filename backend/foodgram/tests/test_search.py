@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+
+from recipes.models import Ingredient, Recipe
+from recipes.search import ingredient_index
+
+URL = '/api/ingredients/'
+
+
+@pytest.fixture
+def ingredients(db):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in ('Сахар', 'сахарная пудра', 'ванильный сахар',
+                     'соль', 'Тростниковый сахар'))
+
+
+def names(response):
+    assert response.status_code == 200
+    return [item['name'] for item in response.json()]
+
+
+def test_prefix_matches_go_before_substring_matches(anon_client,
+                                                    ingredients):
+    assert names(anon_client.get(URL, {'name': 'САХ'})) == [
+        'Сахар', 'сахарная пудра', 'ванильный сахар', 'Тростниковый сахар']
+
+
+def test_results_are_capped(ingredients):
+    assert len(ingredient_index.search('сах', limit=2)) == 2
+
+
+def test_index_rebuilds_on_change(anon_client, ingredients,
+                                  django_capture_on_commit_callbacks):
+    assert names(anon_client.get(URL, {'name': 'перец'})) == []
+    with django_capture_on_commit_callbacks(execute=True):
+        Ingredient.objects.create(name='перец', measurement_unit='г')
+    assert names(anon_client.get(URL, {'name': 'перец'})) == ['перец']
+
+
+@pytest.mark.parametrize('url', (URL, '/api/recipes/'))
+def test_database_search_ranks_prefix_first(anon_client, dataset, url,
+                                            monkeypatch):
+    monkeypatch.setattr('api.views.INGREDIENT_SEARCH_BACKEND', 'database')
+    model = Ingredient if url == URL else Recipe
+    for name in ('xyz bread', 'bread', 'white bread', 'breadcrumbs'):
+        model.objects.create(
+            name=name,
+            **({'measurement_unit': 'г'} if model is Ingredient else
+               {'author': dataset['user'], 'text': '-', 'image': 'x.png',
+                'cooking_time': 1}))
+    response = anon_client.get(url, {'name': 'BREAD'})
+    assert response.status_code == 200
+    data = response.json()
+    if isinstance(data, dict):
+        data = data['results']
+    found = [item['name'] for item in data]
+    assert found == ['bread', 'breadcrumbs', 'white bread', 'xyz bread']
+
+
+def test_recipe_search_rejects_cursor(anon_client, dataset):
+    response = anon_client.get('/api/recipes/', {'name': 'bread',
+                                                 'cursor': ''})
+    assert response.status_code == 400
+    assert 'name' in response.json()
+
+
+def test_catalog_matches_serializer(anon_client, ingredients,
+                                    django_capture_on_commit_callbacks):
+    response = anon_client.get(URL)
+    assert response.content == anon_client.get(URL, {'format': 'json'}
+                                               ).content
+    compressed = anon_client.get(URL, HTTP_ACCEPT_ENCODING='gzip, br')
+    assert compressed['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.content) == response.content
+    assert compressed['ETag'] != response['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        Ingredient.objects.create(name='перец', measurement_unit='г')
+    assert 'перец' in names(anon_client.get(URL))
@@ -0,0 +1,67 @@
+import pytest
+
+from recipes.models import Recipe
+
+
+@pytest.mark.parametrize('recipes_limit', (None, 1, 3))
+def test_subscriptions_recipes_limit(user_client, user, recipes_limit):
+    params = {'limit': 50}
+    if recipes_limit:
+        params['recipes_limit'] = recipes_limit
+    response = user_client.get('/api/users/subscriptions/', params)
+    assert response.status_code == 200
+    authors = response.json()['results']
+    assert len(authors) == user.follower.count()
+    for author in authors:
+        expected = list(Recipe.objects.filter(author=author['id'])
+                        .order_by('-pub_date', '-id')
+                        .values_list('id', flat=True)[:recipes_limit])
+        assert author['is_subscribed'] is True
+        assert author['recipes_count'] == Recipe.objects.filter(
+            author=author['id']).count()
+        assert sorted(item['id'] for item in author['recipes']) == sorted(
+            expected)
+
+
+def test_subscriptions_recipes_limit_validation(user_client):
+    response = user_client.get('/api/users/subscriptions/',
+                               {'recipes_limit': 'all'})
+    assert response.status_code == 400
+
+
+def test_subscribe_recipes_limit(user_client, dataset):
+    author = dataset['users'][1]
+    user_client.delete(f'/api/users/{author.pk}/subscribe/')
+    response = user_client.post(
+        f'/api/users/{author.pk}/subscribe/?recipes_limit=2')
+    assert response.status_code == 201
+    assert len(response.json()['recipes']) == 2
+    assert response.json()['recipes_count'] == author.recipes.count()
+
+
+def test_subscribe_errors(user_client, user, dataset):
+    author = dataset['users'][1]
+    url = f'/api/users/{author.pk}/subscribe/'
+    assert user_client.post(url).status_code == 400
+    assert user_client.delete(url).status_code == 204
+    assert user_client.delete(url).status_code == 400
+    assert user_client.post(
+        f'/api/users/{user.pk}/subscribe/').status_code == 400
+    assert user_client.post('/api/users/0/subscribe/').status_code == 404
+    assert user_client.delete('/api/users/0/subscribe/').status_code == 404
+    author.refresh_from_db()
+    assert author.followers_count == author.following.count()
+
+
+def test_subscribe_batch(user_client, user, dataset):
+    followed = dataset['users'][1].pk
+    response = user_client.post('/api/users/subscribe/batch/', {
+        'add': [user.pk, followed], 'remove': [followed + 1],
+    }, format='json')
+    assert response.status_code == 200, response.content
+    assert response.json() == {
+        'add': [{'id': user.pk, 'status': 'invalid'},
+                {'id': followed, 'status': 'exists'}],
+        'remove': [{'id': followed + 1, 'status': 'removed'}],
+    }
+    assert not user.follower.filter(author=followed + 1).exists()
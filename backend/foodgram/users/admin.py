@@ -8,7 +8,8 @@ class UserAdmin(admin.ModelAdmin):
     """Отображение пользователей в админ-панели."""
 
     list_display = ('pk', 'username', 'first_name', 'last_name',
-                    'email', 'password')
+                    'email', 'password', 'recipes_count',
+                    'followers_count')
     list_editable = ('password',)
     search_fields = ('username', 'date_joined',)
     list_filter = ('is_active',)
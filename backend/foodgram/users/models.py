@@ -1,10 +1,29 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.exceptions import ValidationError
 from django.db import models
 
 LEN_LIMIT = 15
 
 
+class UserQuerySet(models.QuerySet):
+    """Выборки пользователей для сериализаторов API."""
+
+    def with_is_subscribed(self, user):
+        """Аннотирует флаг подписки пользователя user на каждого автора."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_subscribed=models.Value(
+                    False, output_field=models.BooleanField()))
+        return self.annotate(is_subscribed=models.Exists(
+            Follow.objects.filter(user=user, author=models.OuterRef('pk'))))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с выборками UserQuerySet."""
+
+    pass
+
+
 class User(AbstractUser):
     """Модель пользователя."""
 
@@ -22,6 +41,16 @@ class User(AbstractUser):
         verbose_name='Адрес электронной почты',
         unique=True,
         max_length=254)
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False)
+
+    objects = CustomUserManager()
 
     class Meta:
         ordering = ('id',)